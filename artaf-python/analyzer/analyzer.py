@@ -4,8 +4,11 @@ import concurrent.futures
 import contextlib
 import csv
 import datetime
+import itertools
 import multiprocessing
 import os.path
+import queue
+import threading
 import time
 import zipfile
 from collections import namedtuple
@@ -20,6 +23,60 @@ ONE_HOUR = datetime.timedelta(seconds=3600)
 HourlyGroup = namedtuple("HourlyGroup", ["aerodrome", "hour_starting", "items"])
 HourlyItem = namedtuple("HourlyItem", ["issued_at", "amendment", "conditions"])
 
+# How many TAFs the reader thread hands over at a time, and how many such batches it reads ahead
+# of the parser
+READ_BATCH_SIZE = 1024
+READ_AHEAD_BATCHES = 4
+
+# How often, in seconds, we pass progress on to the progress callback at most
+PROGRESS_INTERVAL = 0.25
+
+
+def read_ahead(items, max_queued=READ_AHEAD_BATCHES):
+    """
+    Go through an iterable in a worker thread, keeping up to max_queued items ready for the
+    consumer. Reading TAFs is mostly decompression and file access, which don't hold the GIL, so
+    it can go on while we parse.
+    :param items: The iterable
+    :param max_queued: How many items to read ahead at most
+    :return: A generator of the same items
+    """
+    items_queue = queue.Queue(max_queued)
+    stop = threading.Event()
+
+    def put(entry):
+        # Don't block forever if our consumer has gone away
+        while not stop.is_set():
+            try:
+                items_queue.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            put((False, e))
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    reader_thread.start()
+    try:
+        while True:
+            is_item, item = items_queue.get()
+            if not is_item:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        reader_thread.join()
+
 
 def arrange_by_hour_forecast(tafs, aerodrome):
     """
@@ -100,35 +157,36 @@ class HourlyHistogramKeeper:  # pylint: disable=too-many-instance-attributes
         :param hourly_group: HourlyGroup, must be for one station and in ascending order of issue
         time
         """
-        if len(hourly_group.items) < 3:
+        items = hourly_group.items
+        if len(items) < 3:
             return
 
         ascending_group = tuple((fun(hourly_group) for _, fun in self.ascending_group_by))
-        other_groups = [tuple((fun(hourly_group) for _, fun in self.other_group_by)) for x in
-                        hourly_group.items]
+        # The other group bys look at the hourly group as a whole, so they're the same for all items
+        other_group = tuple((fun(hourly_group) for _, fun in self.other_group_by))
 
         if ascending_group != self.current_ascending_group:
             self.flush()
             self.current_ascending_group = ascending_group
 
+        counts = self.counts
+        middle_items = items[1:-1]
         for value_name, value_fun in self.values:
-            previous_value = value_fun(hourly_group.items[0])
-            final_value = value_fun(hourly_group.items[-1])
-            for item_index in range(1, len(hourly_group.items) - 1):
-                current_value = value_fun(hourly_group.items[item_index])
-                counts_key = other_groups[
-                    item_index], value_name, previous_value, current_value, final_value
-                if counts_key in self.counts:
-                    self.counts[counts_key] += 1
-                else:
-                    self.counts[counts_key] = 1
+            previous_value = value_fun(items[0])
+            final_value = value_fun(items[-1])
+            for item in middle_items:
+                current_value = value_fun(item)
+                counts_key = other_group, value_name, previous_value, current_value, final_value
+                # One lookup rather than a membership test followed by another lookup
+                counts[counts_key] = counts.get(counts_key, 0) + 1
 
                 previous_value = current_value
 
     def flush(self):
         """Write out accumulated statistics."""
         if len(self.counts) > 0:
-            self.counts = dict(sorted(list(self.counts.items()), key=lambda x: str(x[0])))
+            # sorted() makes its own list, so there's no need to make one for it first
+            self.counts = dict(sorted(self.counts.items(), key=lambda x: str(x[0])))
             self.callback(self.current_ascending_group, self.counts, self.callback_info)
         self.counts = {}
 
@@ -138,11 +196,13 @@ class ParallelContext:  # pragma: no cover
     """This is a placeholder class for HourlyHistogramProcessor that can get pickled and passed
     to different processes in parallel processing."""
 
-    def __init__(self, jobs, output_queue, show_progress_after, abort_after):
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+            self, jobs, output_queue, show_progress_after, abort_after, fast_path):
         self.output_queue = output_queue
         self.jobs = jobs
         self.show_progress_after = show_progress_after
         self._abort_after = abort_after
+        self.fast_path = fast_path
 
     def receive_output(self, ascending_group, counts, job_index):
         """Remote access to HourlyHistogramProcessor.receive_output"""
@@ -161,14 +221,18 @@ class ParallelContext:  # pragma: no cover
 class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
     """Automates the parsing and processing of TAFs"""
 
-    def __init__(self, jobs, output_dir, progress_callback=None, parallel=False):
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+            self, jobs, output_dir, progress_callback=None, parallel=False, fast_path=True):
         """
         Make a new processor
         :param jobs: A list of HourlyHistogramJob objects
         :param output_dir: the directory in which to write output
         :param progress_callback: a function(tafs_parsed, hours_parsed, errors_encountered) to
-        display progress
-        :param parallel: Process in parallel
+        display progress, called at most every PROGRESS_INTERVAL seconds
+        :param parallel: Process in parallel, True for worker processes or "threads" for worker
+        threads
+        :param fast_path: Parse plain TAFs without Lark, which is a lot faster and gives the same
+        results, see meteoparse.parse_taf()
         """
         self.jobs = jobs
         self.output_dir = output_dir
@@ -182,8 +246,10 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
         self.progress_callback = progress_callback
         self.output_queue = None
         self.parallel = parallel
+        self.fast_path = fast_path
         self._abort_after = None
         self.show_progress_after = 10_000
+        self._next_progress_time = 0.0
 
     def process(self, stations, year_from, year_to):
         """
@@ -203,22 +269,7 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
             # map() is a generator -- list forces evaluation
             evaluations = [(s, year_from, year_to) for s in stations]
             if self.parallel:
-                with (concurrent.futures.ProcessPoolExecutor() as executor,
-                      multiprocessing.Manager() as manager):
-                    self.output_queue = manager.Queue()
-                    context = ParallelContext(self.jobs, self.output_queue,
-                                              self.show_progress_after, self._abort_after)
-                    futures = [executor.submit(self._process_station, e, context) for e in
-                               evaluations]
-                    while True:
-                        if all(f.done() for f in futures) and self.output_queue.empty():
-                            break
-                        if not self.output_queue.empty():
-                            method, payload = self.output_queue.get()
-                            getattr(self, method)(*payload)
-                        else:
-                            time.sleep(0.1)
-                    list((f.result() for f in futures))
+                self._process_parallel(evaluations)
             else:
                 context = self
                 for e in evaluations:
@@ -231,6 +282,36 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
             writer.writerow(["hours_processed", self.processed_hours])
             writer.writerow(["errors", self.processed_errors])
 
+    def _process_parallel(self, evaluations):
+        """
+        Process stations in worker processes or, if self.parallel is "threads", in worker threads
+        that share one parser. Threads save starting up processes and copying the grammar, but
+        they only pay off as far as the work isn't holding the GIL.
+        :param evaluations: A list of parameter tuples for _process_station()
+        """
+        with contextlib.ExitStack() as exit_stack:
+            if self.parallel == "threads":
+                executor = exit_stack.enter_context(concurrent.futures.ThreadPoolExecutor())
+                self.output_queue = queue.Queue()
+            else:
+                executor = exit_stack.enter_context(concurrent.futures.ProcessPoolExecutor())
+                manager = exit_stack.enter_context(multiprocessing.Manager())
+                self.output_queue = manager.Queue()
+            context = ParallelContext(self.jobs, self.output_queue,
+                                      self.show_progress_after, self._abort_after,
+                                      self.fast_path)
+            futures = [executor.submit(self._process_station, e, context) for e in
+                       evaluations]
+            while True:
+                if all(f.done() for f in futures) and self.output_queue.empty():
+                    break
+                if not self.output_queue.empty():
+                    method, payload = self.output_queue.get()
+                    getattr(self, method)(*payload)
+                else:
+                    time.sleep(0.1)
+            list((f.result() for f in futures))
+
     def _initialize_output_files(self, exit_stack):
         self.out_files = [
             exit_stack.enter_context(
@@ -256,10 +337,11 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
         """
         Receive output to be written into output files
         """
-        for (other_group, field_name, prev, curr, final), ncount in counts.items():
-            new_row = list(ascending_group) + list(other_group) + \
-                      [field_name, prev, curr, final, ncount]
-            self.out_writers[job_index].writerow(new_row)
+        ascending_group = list(ascending_group)
+        # One writerows() call saves going through the writer for every single row
+        self.out_writers[job_index].writerows(
+            ascending_group + list(other_group) + [field_name, prev, curr, final, ncount]
+            for (other_group, field_name, prev, curr, final), ncount in counts.items())
 
     def progress(self, tafs_parsed, station_processed_hours, station_processed_errors):
         """Receive a progress message to be displayed"""
@@ -267,7 +349,12 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
         self.processed_hours += station_processed_hours
         self.processed_errors += station_processed_errors
         if self.progress_callback is not None:
-            self.progress_callback(self.tafs_parsed, self.processed_hours, self.processed_errors)
+            # With many small stations, progress comes in faster than anyone can read it
+            now = time.monotonic()
+            if now >= self._next_progress_time:
+                self._next_progress_time = now + PROGRESS_INTERVAL
+                self.progress_callback(self.tafs_parsed, self.processed_hours,
+                                       self.processed_errors)
 
     def write_error(self, message_text, error, hint):
         """Receive a parse error to be logged"""
@@ -275,10 +362,24 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
         self.error_writer.writerow([message_text, error, hint])  # pragma: no cover
 
     @staticmethod
-    def _process_station(params, context): # pylint: disable=too-many-locals
+    def _process_station(params, context):
         station, year_from, year_to = params
-        tafs = meteostore.get_tafs([station], year_from, year_to, read_only=True)
-        station, station_tafs = next(tafs)
+        tafs = meteostore.get_tafs([station], year_from, year_to, read_only=True,
+                                   batch_size=READ_BATCH_SIZE)
+        station, station_batches = next(tafs)
+        batches_ahead = read_ahead(station_batches)
+        try:
+            HourlyHistogramProcessor._process_station_tafs(
+                station, itertools.chain.from_iterable(batches_ahead), context)
+        finally:
+            # The reader thread reads from the files get_tafs() opened, so it has to be done before
+            # they get closed. Left to garbage collection, this might happen the other way around.
+            batches_ahead.close()
+            station_batches.close()
+            tafs.close()
+
+    @staticmethod
+    def _process_station_tafs(station, station_tafs, context): # pylint: disable=too-many-locals
         tafs_processed = 0
 
         def count_tafs(my_tafs):
@@ -287,26 +388,29 @@ class HourlyHistogramProcessor:  # pylint: disable=too-many-instance-attributes
                 tafs_processed += 1
                 yield taf
 
-        parsed_tafs = count_tafs(meteoparse.parse_tafs(station_tafs))
+        parsed_tafs = count_tafs(meteoparse.parse_tafs(station_tafs, context.fast_path))
         expanded_tafs = meteoparse.regularize_tafs(parsed_tafs)
         arranged_forecasts = arrange_by_hour_forecast(expanded_tafs, station.station)
         station_processed_hours_total = 0
         station_processed_errors = 0
         keepers = [HourlyHistogramKeeper(
             context.jobs[i], context.receive_output, i) for i in range(len(context.jobs))]
+        # This loop runs for every hour of every station, so we look things up only once
+        process_hourly_groups = [k.process_hourly_group for k in keepers]
+        show_progress_after = context.show_progress_after
+        abort_after = context._abort_after  # pylint: disable=protected-access
         for hourly_data in arranged_forecasts:
-            if isinstance(hourly_data, HourlyGroup):
-                for k in keepers:
-                    k.process_hourly_group(hourly_data)
+            # Nothing subclasses HourlyGroup, so checking the exact type is enough
+            if type(hourly_data) is HourlyGroup:  # pylint: disable=unidiomatic-typecheck
+                for process_hourly_group in process_hourly_groups:
+                    process_hourly_group(hourly_data)
                 station_processed_hours_total += 1
-                if station_processed_hours_total % context.show_progress_after == 0:
-                    context.progress(tafs_processed, context.show_progress_after,
+                if station_processed_hours_total % show_progress_after == 0:
+                    context.progress(tafs_processed, show_progress_after,
                                      station_processed_errors)
                     station_processed_errors = 0
                     tafs_processed = 0
-                if (context._abort_after is not None  # pylint: disable=protected-access
-                        and station_processed_hours_total ==
-                        context._abort_after):  # pylint: disable=protected-access
+                if abort_after is not None and station_processed_hours_total == abort_after:
                     break
             # Fine not to exercise these in a tiny test dataset
             elif isinstance(hourly_data, meteoparse.TafParseError):  # pragma: no cover
@@ -16,7 +16,8 @@ def get_aerodrome(hourly_group):
 
 def get_year(hourly_group):
     "Extract year"
-    return hourly_group.hour_starting.strftime("%Y")
+    # This runs for every hour of every station, and str() is much cheaper than strftime()
+    return str(hourly_group.hour_starting.year)
 
 
 def get_wind_speed(hourly_item):
@@ -67,12 +68,13 @@ def get_visibility(hourly_item):
 
 def get_clouds_ceiling(hourly_item):
     "Extract altitude of lowest cloud layer with more than 50% coverage"
-    ceiling_layers = [c for c in hourly_item.conditions.clouds if float(c.coverage) >= 0.5]
     # the highest cloud altitude we care about
     max_altitude = 18_000
-    if not ceiling_layers:
-        return max_altitude
-    return min(ceiling_layers[0].cloud_base, max_altitude)
+    # Layers come from the bottom up, so the first one covering at least half the sky is it
+    for cloud_layer in hourly_item.conditions.clouds:
+        if float(cloud_layer.coverage) >= 0.5:
+            return min(cloud_layer.cloud_base, max_altitude)
+    return max_altitude
 
 
 DEFAULT_JOBS = [HourlyHistogramJob(name="YearlyStations",
@@ -1,3 +1,4 @@
 """General helper functions"""
 
-from artaf_util.file_util import safe_open_write, safe_open_compressed_text_zip_write
+from artaf_util.file_util import (replace_durably, safe_open_write,
+                                  safe_open_compressed_text_zip_write)
@@ -6,6 +6,19 @@ import zipfile
 from contextlib import contextmanager
 
 
+def replace_durably(new_file, file):
+    """
+    Put a newly written file in place of another, making sure it has reached the disk first, so
+    that a crash leaves either the old file or the complete new one, never a truncated one.
+    Unlike os.rename(), this also works on Windows if the file already exists.
+    :param new_file: Path of the newly written file
+    :param file: Path of the file to be replaced
+    """
+    with open(new_file, "r+b") as handle:
+        os.fsync(handle.fileno())
+    os.replace(new_file, file)
+
+
 @contextmanager
 def safe_open_write(file, mode, new_file_suffix="~", **kwargs):
     """
@@ -34,7 +47,7 @@ def safe_open_write(file, mode, new_file_suffix="~", **kwargs):
         except Exception as e:  # pylint: disable=broad-exception-caught
             failure = e
     if failure is None:
-        os.rename(file + new_file_suffix, file)
+        replace_durably(file + new_file_suffix, file)
     else:
         os.unlink(file + new_file_suffix)
         raise failure
@@ -69,7 +82,7 @@ def safe_open_compressed_text_zip_write(compressed_path, inner_file_name, encodi
         except Exception as e:  # pylint: disable=broad-exception-caught
             failure = e
     if failure is None:
-        os.rename(compressed_path + new_file_suffix, compressed_path)
+        replace_durably(compressed_path + new_file_suffix, compressed_path)
     else:
         os.unlink(compressed_path + new_file_suffix)
         raise failure
@@ -1,18 +1,21 @@
 """This is the parser for TAFs. Function parse_taf() does all the work. We're using Lark as our
 parser generator, in the LALR mode for speed. In addition to the grammar in lark/taf.lark, class
-TafTreeTransformer does the remaining heavy lifting of building Pythonic output objects."""
+TafTreeTransformer does the remaining heavy lifting of building Pythonic output objects. For TAFs of
+the plain, common shape, there is an optional fast path that bypasses Lark altogether."""
 
 import collections
 import csv
 import datetime
 import os
 import os.path
+import re
+import threading
 from enum import Enum
 
 import lark
 
 import meteostore
-from meteoparse.tree_accessor import TreeAccessor
+from meteoparse.tree_accessor import TreeAccessor, make_tree_accessor_class
 from meteoparse.weatherobjects import CloudLayer, CloudCoverage, Visibility, Wind
 
 
@@ -41,6 +44,11 @@ TafParseError = collections.namedtuple(
     ["error", "message_text", "hint"]
 )
 
+# Accessors with real properties for the nodes we look at most
+_TafAccessor = make_tree_accessor_class(("header", "preamble", "taf_content"))
+_FromGroupAccessor = make_tree_accessor_class(("from_conditions",))
+_WindGroupAccessor = make_tree_accessor_class(("wind_direction", "WIND_SPEED", "wind_gust_group"))
+
 
 # The case of the methods is given by the conventions expected by Lark
 # noinspection PyMethodMayBeStatic,PyPep8Naming
@@ -71,9 +79,24 @@ class TafTreeTransformer(lark.Transformer):
                                      day, hour, minute)
         return datetime.datetime(self.issue_date.year + 1, 1, day, hour, minute)
 
+    def make_datetime_from_day_hour(self, day, hour):
+        """Turns a DDHH time specification as found in TAFs into a proper datetime"""
+        # Sometimes midnight in this format gets encoded as 24:00 of the preceding day
+        if hour == 24:
+            increment_day = True
+            hour = 0
+        else:
+            increment_day = False
+
+        res = self.make_datetime_from_day_hour_minute(day, hour, 0)
+
+        if increment_day:
+            res += datetime.timedelta(days=1)
+        return res
+
     def start(self, branches):
         """Transform the topmost node of the AST, i.e., the entire TAF"""
-        tree = TreeAccessor(branches)
+        tree = _TafAccessor(branches)
 
         # Extract header information we need for parsing -- we'll extract the others
         # when we construct the output tuple below
@@ -120,7 +143,7 @@ class TafTreeTransformer(lark.Transformer):
         :param branches: A list of lark.Tree or lark.Token objects
         :return: WeatherCondition tuple
         """
-        from_conditions = TreeAccessor(branches).from_conditions
+        from_conditions = _FromGroupAccessor(branches).from_conditions
         wind = from_conditions.WIND_GROUP.value
         visibility = from_conditions.VISIBILITY_GROUP.value
         cloud_layers_group = from_conditions.clouds.children
@@ -137,7 +160,7 @@ class TafTreeTransformer(lark.Transformer):
 
     def wind_group(self, branches):
         """Parse wind, including direction and gust"""
-        elements = TreeAccessor(branches)
+        elements = _WindGroupAccessor(branches)
         return lark.Token("WIND_GROUP", Wind(
             None
             if hasattr(elements.wind_direction, "WIND_DIRECTION_VARIABLE") else
@@ -171,7 +194,7 @@ class TafTreeTransformer(lark.Transformer):
         """Parses as VV group as a CloudLayer"""
         return CloudLayer(
             int(token[0].value) * 100,
-            CloudCoverage("VV"),
+            CloudCoverage.get("VV"),
             False
         )
 
@@ -206,19 +229,7 @@ class TafTreeTransformer(lark.Transformer):
         s = token.value
         day = int(s[0:2])
         hour = int(s[2:4])
-
-        # Sometimes midnight in this format gets encoded as 24:00 of the preceding day
-        if hour == 24:
-            increment_day = True
-            hour = 0
-        else:
-            increment_day = False
-
-        res = self.make_datetime_from_day_hour_minute(day, hour, 0)
-
-        if increment_day:
-            res += datetime.timedelta(days=1)
-        return token.update(value=res)
+        return token.update(value=self.make_datetime_from_day_hour(day, hour))
 
     def HEADER_AMENDMENT(self, token):
         """Header amendment AMD or COR"""
@@ -231,7 +242,7 @@ class TafTreeTransformer(lark.Transformer):
     # We don't need to parse the clear sky token as it can only carry one value
     def CLOUDS_SKY_CLEAR(self, token):  # pylint: disable=unused-argument
         """Cloud layer with sky clear"""
-        return CloudLayer(None, CloudCoverage("SKC"), False)
+        return CloudLayer(None, CloudCoverage.get("SKC"), False)
 
 
 # Was disabled above to allow for Lark transformer method names
@@ -240,20 +251,158 @@ class TafTreeTransformer(lark.Transformer):
 
 LARK_DIR = os.path.join("artaf-python", "meteoparse", "lark")
 
+# The fast path below handles the plain shape most TAFs come in without going through Lark at all.
+# It must only ever accept a subset of what the grammar in lark/taf.lark accepts, and it must give
+# the very same results. Whenever a TAF deviates from the plain shape, e.g., by having TEMPO or PROB
+# groups or an amendment limitation, the fast path gives up and Lark takes over.
+_FAST_WHITESPACE = " \t\f\r\n"
+_FAST_WHITESPACE_RE = re.compile(r"[ \t\f\r\n]+")
+_FAST_HEADER_RE = re.compile(
+    r"\d{3} [A-Z]{4}\d{2} (?P<issued_in>[A-Z]{4})(?: (?P<preamble_issued_at>\d{6}))?"
+    r"(?: [A-Z]{3})? TAF[A-Z]{3} "
+    r"TAF(?: (?P<amendment>AMD|COR))? (?P<aerodrome>[A-Z]{4}) (?P<issued_at>\d{6})Z "
+    r"(?P<valid_from>\d{4})/(?P<valid_until>\d{4}) ")
+_FAST_FROM_RE = re.compile(r" FM(\d{6}) ")
+_FAST_AMENDMENTS = {"AMD": AmendmentType.AMENDED, "COR": AmendmentType.CORRECTED}
+# Wind directions as WIND_DIRECTION_DEGREES and WIND_DIRECTION_VARIABLE in the grammar
+_FAST_WIND_DIRECTION = r"VRB|0\d{2}|[12]\d{2}|3[0-5]\d|360"
+_FAST_CONDITIONS_RE = re.compile(
+    r"(?P<wind_direction>" + _FAST_WIND_DIRECTION + r")(?P<wind_speed>\d{2})"
+    r"(?:G(?P<wind_gust>\d{2}))?KT "
+    r"(?P<visibility_exceeding>P)?"
+    r"(?:(?P<visibility_miles>\d)(?: (?P<visibility_fraction>\d/\d))?"
+    r"|(?P<visibility_only_fraction>\d/\d))SM"
+    r"(?: [+-]?(?:VC|MI|PR|BC|DR|BL|SH|TS|FZ|DZ|RA|SN|SG|IC|PL|GR|GS|UP|BR|FG|FU|VA|DU|SA|HZ|PY"
+    r"|PO|SQ|FC|SS|DS)+)* "
+    r"(?P<clouds>SKC|VV\d{3}|(?:FEW|SCT|BKN|OVC)\d{3}(?:CB)?(?: (?:FEW|SCT|BKN|OVC)\d{3}(?:CB)?)*)"
+    r"(?: WS\d{3}/(?:" + _FAST_WIND_DIRECTION + r")\d{2}KT)?")
+
+
+def _split_day_hour_minute(s):
+    """Split a DDHHMM time specification into integers"""
+    return int(s[0:2]), int(s[2:4]), int(s[4:6])
+
+
+def _fast_parse_conditions(text):
+    """
+    Parse the conditions of a from group on the fast path
+    :param text: The conditions, with tokens separated by single spaces
+    :return: WeatherConditions, or None if the conditions don't have the plain shape
+    """
+    match = _FAST_CONDITIONS_RE.fullmatch(text)
+    if match is None:
+        return None
+    direction = match["wind_direction"]
+    wind = Wind(None if direction == "VRB" else int(direction), int(match["wind_speed"]),
+                match["wind_gust"])
+
+    visibility_miles = int(match["visibility_miles"]) if match["visibility_miles"] else 0
+    fraction_text = match["visibility_fraction"] or match["visibility_only_fraction"]
+    if fraction_text:
+        enumerator, denominator = tuple(fraction_text.split("/"))
+        visibility_miles += int(enumerator) / int(denominator)
+    visibility = Visibility(visibility_miles, match["visibility_exceeding"] is not None)
+
+    clouds_text = match["clouds"]
+    if clouds_text == "SKC":
+        clouds = [CloudLayer(None, CloudCoverage.get("SKC"), False)]
+    elif clouds_text.startswith("VV"):
+        clouds = [CloudLayer(int(clouds_text[2:]) * 100, CloudCoverage.get("VV"), False)]
+    else:
+        clouds = [CloudLayer(int(layer[3:6]) * 100, layer[:3], layer.endswith("CB"))
+                  for layer in clouds_text.split(" ")]
+        for i in range(len(clouds) - 1):
+            if clouds[i].cloud_base > clouds[i + 1].cloud_base:
+                # Let Lark produce the proper error
+                return None
+
+    return WeatherConditions(wind=wind, clouds=clouds, visibility=visibility)
+
+
+def _fast_parse(message_time, message):
+    """
+    Parse a TAF of the plain common shape without Lark. See the comment above for what
+    plain means.
+    :param message_time: Datetime of the TAF in UTC
+    :param message: Raw text of the TAF
+    :return: ParsedForecast with the TAF's content, or None if the TAF isn't of the plain shape
+    """
+    text = _FAST_WHITESPACE_RE.sub(" ", message.strip(_FAST_WHITESPACE))
+    if not text.endswith("="):
+        return None
+    header = _FAST_HEADER_RE.match(text)
+    if header is None:
+        return None
+    body = text[header.end():-1].rstrip(" ")
+
+    # We only need the transformer for its date arithmetic
+    transformer = TafTreeTransformer(message_time)
+    try:
+        if header["preamble_issued_at"]:
+            # Not part of the output, but Lark would reject an impossible date
+            transformer.make_datetime_from_day_hour_minute(
+                *_split_day_hour_minute(header["preamble_issued_at"]))
+        valid_from = transformer.make_datetime_from_day_hour(
+            int(header["valid_from"][0:2]), int(header["valid_from"][2:4]))
+        valid_until = transformer.make_datetime_from_day_hour(
+            int(header["valid_until"][0:2]), int(header["valid_until"][2:4]))
+        issued_at = transformer.make_datetime_from_day_hour_minute(
+            *_split_day_hour_minute(header["issued_at"]))
+
+        if body == "NIL":
+            new_from_lines = None
+        else:
+            # Splitting on the from groups leaves us with alternating conditions and from times
+            parts = _FAST_FROM_RE.split(body)
+            from_lines = [_fast_parse_conditions(p) for p in parts[0::2]]
+            if any(f is None for f in from_lines):
+                return None
+            from_line_times = \
+                [valid_from] + \
+                [transformer.make_datetime_from_day_hour_minute(*_split_day_hour_minute(p))
+                 for p in parts[1::2]] + \
+                [valid_until]
+            new_from_lines = [
+                FromLine(conditions=from_lines[i], valid_from=from_line_times[i],
+                         valid_until=from_line_times[i + 1])
+                for i in range(len(from_lines))]
+    except (AssertionError, ValueError, ZeroDivisionError):
+        # Lark will turn these into a proper TafParseError
+        return None
+
+    return ParsedForecast(
+        aerodrome=header["aerodrome"],
+        issued_at=issued_at,
+        issued_in=header["issued_in"],
+        valid_from=valid_from,
+        valid_until=valid_until,
+        amendment=_FAST_AMENDMENTS.get(header["amendment"]),
+        from_lines=new_from_lines)
+
 
 # noinspection PyShadowingNames
-def parse_taf(message_time, message):
+def parse_taf(message_time, message, fast_path=False):
     """
     Parse a TAF
     :param message_time: Datetime of the TAF in UTC. Knowledge of the current date is presumed in
     TAFs' abbreviated notation.
     :param message: Raw test of the TAF
+    :param fast_path: Try parsing plain TAFs without Lark first, which is a lot faster
     :return: ParsedForecast with the TAF's content, or TafParseError with what went wong
     """
-    # The parser is expensive to generate, so we memoize it
+    if fast_path:
+        res = _fast_parse(message_time, message)
+        if res is not None:
+            return res
+
+    # The parser is expensive to generate, so we memoize it. It is shared by all threads, so we
+    # make sure only one of them generates it.
     if parse_taf.parser is None:
-        with open(os.path.join(LARK_DIR, "taf.lark"), "r", encoding="ascii") as lark_grammar:
-            parse_taf.parser = lark.Lark(lark_grammar, parser="lalr")
+        with _PARSER_LOCK:
+            if parse_taf.parser is None:
+                with open(os.path.join(LARK_DIR, "taf.lark"), "r",
+                          encoding="ascii") as lark_grammar:
+                    parse_taf.parser = lark.Lark(lark_grammar, parser="lalr")
 
     try:
         tree = parse_taf.parser.parse(message)
@@ -272,17 +421,19 @@ def parse_taf(message_time, message):
 # This serves to memoize the one instance of the parser we're creating and will be initialized
 # in the first call to parse_tafs()
 parse_taf.parser = None
+_PARSER_LOCK = threading.Lock()
 
 
-def parse_tafs(taf_sequence):
+def parse_tafs(taf_sequence, fast_path=False):
     """
     Parse a sequence of raw TAFs and make a sequence of ParsedForecast tuples out of them
     :param taf_sequence: a sequence of datetime.datetime, str tuples with the time and content of
     the raw TAF
+    :param fast_path: Try parsing plain TAFs without Lark first, see parse_taf()
     :return: a sequence of ParsedForecast tuples and/or TafParseError for TAFs that failed to parse
     """
     for taf_date, taf_text in taf_sequence:
-        res = parse_taf(taf_date, taf_text)
+        res = parse_taf(taf_date, taf_text, fast_path)
         # taf_date is no longer needed because now the TAF itself is augmented with full dates
         yield res
 
@@ -1,9 +1,16 @@
-"""This implements two convenience classes and a factory function to allow us to access Lark parse
+"""This implements a convenience class and a factory function to allow us to access Lark parse
 trees in a more Pythonic way.
 """
 
+import functools
+
 import lark
 
+# Lark doesn't subclass these, so an identity check on the type is enough and cheaper than
+# isinstance()
+_TREE = lark.Tree
+_TOKEN = lark.Token
+
 
 class TreeAccessor:
     """
@@ -15,11 +22,19 @@ class TreeAccessor:
     :return: A wrapper around item that provides access via property calls, indexers, and len()
     """
 
+    # We create a great many of these while walking the parse trees, so we keep them small
+    __slots__ = ("children", "_by_name", "_decorated")
+
     def __init__(self, item):
-        if isinstance(item, lark.Tree):
+        if type(item) is _TREE:  # pylint: disable=unidiomatic-typecheck
             self.children = item.children
         else:
             self.children = item
+        # Children grouped by name, built on the first lookup by name
+        self._by_name = None
+        # Children with subtrees wrapped in accessors, built on first use, so that looking at the
+        # same subtree again gives the same accessor along with whatever that has already cached
+        self._decorated = None
 
     def __getattr__(self, item):
         """
@@ -29,10 +44,7 @@ class TreeAccessor:
         :return: property value, the unique element of the underlying data structure matching the
         name of item
         """
-        candidates = self[item]
-        if len(candidates) != 1:
-            raise AttributeError("Expected to find exactly one selected child node.")
-        return candidates[0]
+        return self._unique_child(item)
 
     def __getitem__(self, item):
         """
@@ -41,26 +53,58 @@ class TreeAccessor:
         :return: The selected children as a list
         """
         if isinstance(item, slice):
-            return [self._decorate_child(a) for a in self.children[item]]
+            return self._decorated_children()[item]
         if isinstance(item, int):
-            return self._decorate_child(self.children[item])
+            return self._decorated_children()[item]
         if isinstance(item, str):
-            res = []
-            for branch in self.children:
-                if isinstance(branch, lark.Tree):
-                    if branch.data == item:
-                        res.append(TreeAccessor(branch))
-                elif isinstance(branch, lark.Token):
-                    if branch.type == item:
-                        res.append(branch)
-                else:
-                    raise TypeError("Unexpected type hanging in our Lark tree.")
-            return res
+            if self._by_name is None:
+                self._by_name = self._partition_children()
+            return self._by_name.get(item, [])
         raise IndexError("I don't know how to use this index.")
 
     def __len__(self):
         return len(self.children)
 
+    def _partition_children(self):
+        """
+        Group the children by name in one pass, so that every lookup by name is a dict access
+        rather than another scan over all children
+        :return: A dict mapping names to lists of the children of that name
+        """
+        by_name = {}
+        for branch, decorated in zip(self.children, self._decorated_children()):
+            branch_type = type(branch)
+            if branch_type is _TREE:
+                by_name.setdefault(branch.data, []).append(decorated)
+            elif branch_type is _TOKEN:
+                by_name.setdefault(branch.type, []).append(branch)
+            else:
+                raise TypeError("Unexpected type hanging in our Lark tree.")
+        return by_name
+
+    def _unique_child(self, name):
+        """
+        Get the one child of the given name straight from the index by name, without going
+        through a list of candidates
+        :param name: The name of the child
+        :return: The child
+        """
+        if self._by_name is None:
+            self._by_name = self._partition_children()
+        candidates = self._by_name.get(name)
+        if candidates is None or len(candidates) != 1:
+            raise AttributeError("Expected to find exactly one selected child node.")
+        return candidates[0]
+
+    def _decorated_children(self):
+        """
+        Get the children with subtrees wrapped in accessors, wrapping them on first use
+        :return: A list of the decorated children
+        """
+        if self._decorated is None:
+            self._decorated = [self._decorate_child(a) for a in self.children]
+        return self._decorated
+
     @staticmethod
     def _decorate_child(item):
         """
@@ -68,6 +112,33 @@ class TreeAccessor:
         :param item: item to be decorated with an accessor
         :return: decorated item
         """
-        if isinstance(item, lark.Tree):
+        if type(item) is _TREE:  # pylint: disable=unidiomatic-typecheck
             return TreeAccessor(item)
         return item
+
+
+def _make_child_property(name):
+    """
+    Make a property giving the one child of the given name, like TreeAccessor.__getattr__ does
+    :param name: The name of the child
+    :return: The property
+    """
+
+    def get_child(self):
+        return self._unique_child(name)  # pylint: disable=protected-access
+
+    return property(get_child, doc=f"The one child node named {name}")
+
+
+@functools.lru_cache(maxsize=None)
+def make_tree_accessor_class(field_names):
+    """
+    Make a TreeAccessor subclass with real properties for the given child names. These skip the
+    detour through __getattr__ for nodes whose fields we know ahead of time and access a lot.
+    Other names keep working as with any TreeAccessor.
+    :param field_names: A tuple of child names
+    :return: The TreeAccessor subclass, the same one for the same names
+    """
+    namespace = {name: _make_child_property(name) for name in field_names}
+    namespace["__slots__"] = ()
+    return type("TreeAccessor_" + "_".join(field_names), (TreeAccessor,), namespace)
@@ -2,13 +2,37 @@
 
 import math
 
-
-class CloudLayer:
+# Definitions in AC 00-45H, section 5.11.2.9.1
+_COVERAGE_FLOAT = {
+    "SKC": 0.0,  # exactly no clouds -- the slightest whiff is FEW
+    "FEW": 0.125,  # 0 - 2 oktas
+    "SCT": .375,  # 3 - 4 oktas
+    "BKN": .6875,  # 5- 7 oktas
+    "OVC": 0.9375,  # 7-8 oktas
+    # there is no encoding parallelling SKC for exactly 100%
+    "VV": 1.0,  # Sky not visible anywhere
+}
+
+_COVERAGE_ENGLISH = {
+    "SKC": "Sky clear",
+    "FEW": "Few",
+    "SCT": "Scattered",
+    "BKN": "Broken",
+    "OVC": "Overcast",
+    "VV": "Vertical visibility",
+}
+
+
+class CloudLayer:  # pylint: disable=too-few-public-methods
     """
     Represents the cloud layer with altitude in feet, cloud coverage as a
     CloudCoverage object, and whether the cloud is cumulonimbus as a boolean.
+    The altitude is a multiple of 100 feet between 0 and 99,900 feet, which is what the three
+    digits of a cloud group can express, or None for a clear sky.
     """
 
+    __slots__ = ("cloud_base", "coverage", "is_cumulonimbus", "is_sky_clear")
+
     def __init__(self, altitude, coverage, cb):
         self.cloud_base = altitude
 
@@ -18,66 +42,54 @@ class CloudLayer:
         if isinstance(coverage, CloudCoverage):
             self.coverage = coverage
         else:
-            self.coverage = CloudCoverage(coverage)
+            self.coverage = CloudCoverage.get(coverage)
 
         self.is_cumulonimbus = cb
+        # Is the sky clear? We look this up a lot, so we work it out once here.
+        self.is_sky_clear = self.coverage.coverage_string == "SKC"
 
     def __str__(self):
         human_readable_altitude = f"{self.cloud_base} feet" if self.cloud_base != 0 else ""
         return (f"{self.coverage.in_english()} {human_readable_altitude}"
                 f"{', cumulonimbus' if self.is_cumulonimbus else ''}")
 
-    @property
-    def is_sky_clear(self):
-        """Is the sky clear?"""
-        return self.coverage.coverage_string == "SKC"
-
 
 class CloudCoverage:
-    """Represents a cloud layer coverage as either a string or float."""
+    """Represents a cloud layer coverage as either a string or float. Instances are shared, so
+    don't modify them; use CloudCoverage.get() to obtain one."""
+
+    __slots__ = ("coverage_string",)
 
     def __init__(self, cloud_coverage):
         self.coverage_string = cloud_coverage
 
+    @classmethod
+    def get(cls, cloud_coverage):
+        """
+        Get the shared instance for a coverage code, or a new one if the code is unusual
+        :param cloud_coverage: The coverage code, e.g., "BKN"
+        :return: A CloudCoverage object
+        """
+        return _COVERAGE_CACHE.get(cloud_coverage) or cls(cloud_coverage)
+
     def __str__(self):
         return self.coverage_string
 
     def __float__(self):
-        # Definitions in AC 00-45H, section 5.11.2.9.1
-        if self.coverage_string == "SKC":
-            coverage_float = 0.0  # exactly no clouds -- the slightest whiff is FEW
-        elif self.coverage_string == "FEW":
-            coverage_float = 0.125  # 0 - 2 oktas
-        elif self.coverage_string == "SCT":
-            coverage_float = .375  # 3 - 4 oktas
-        elif self.coverage_string == "BKN":
-            coverage_float = .6875  # 5- 7 oktas
-        elif self.coverage_string == "OVC":
-            coverage_float = 0.9375  # 7-8 oktas
-            # there is no encoding parallelling SKC for exactly 100%
-        elif self.coverage_string == "VV":
-            coverage_float = 1.0  # Sky not visible anywhere
-        else:
-            raise ValueError(f"Unexpected type of cloud coverage: '{self.coverage_string}'")
-
-        return coverage_float
+        try:
+            return _COVERAGE_FLOAT[self.coverage_string]
+        except KeyError as e:
+            raise ValueError(
+                f"Unexpected type of cloud coverage: '{self.coverage_string}'") from e
 
     def in_english(self):
         """Return a natural language string representation of the cloud coverage"""
-        english_string = "Unknown"
-        if self.coverage_string == "SKC":
-            english_string = "Sky clear"
-        if self.coverage_string == "FEW":
-            english_string = "Few"
-        if self.coverage_string == "SCT":
-            english_string = "Scattered"
-        if self.coverage_string == "BKN":
-            english_string = "Broken"
-        if self.coverage_string == "OVC":
-            english_string = "Overcast"
-        if self.coverage_string == "VV":
-            english_string = "Vertical visibility"
-        return english_string
+        return _COVERAGE_ENGLISH.get(self.coverage_string, "Unknown")
+
+
+# There are only a handful of coverage codes, so we keep one instance for each around rather than
+# creating a new one for each of millions of cloud layers
+_COVERAGE_CACHE = {s: CloudCoverage(s) for s in _COVERAGE_FLOAT}
 
 
 class Visibility:  # pylint: disable=too-few-public-methods
@@ -88,6 +100,8 @@ class Visibility:  # pylint: disable=too-few-public-methods
     # want to analyze TAFs produced in other countries, they use meters instead of statute miles;
     # you'll need to write another method or rewrite this one.
 
+    __slots__ = ("visibility_miles", "is_excess")
+
     def __init__(self, visibility_miles, is_excess):
         self.visibility_miles = float(visibility_miles)
         self.is_excess = bool(is_excess)
@@ -98,7 +112,10 @@ class Visibility:  # pylint: disable=too-few-public-methods
 
 class Wind:
     """Wind with the possibility of a given or variable direction and of gusts.
-    Direction is in degrees and speeds are in knots"""
+    Direction is in whole degrees from 0 to 359, or None if variable, and speeds are in knots,
+    from 0 to 99 as the grammar only accepts two digits for them"""
+
+    __slots__ = ("direction", "speed", "gust")
 
     def __init__(self, direction, speed, gust):
         self.direction = int(direction) if direction is not None else None
@@ -130,17 +147,21 @@ class Wind:
         if self.direction is None:
             return (None, None)
         speed = self.speed_with_gust if with_gust else self.speed
-        direction_radians = math.radians(self.direction)
-        # Rounding is to compensate for floating point error at wind headings
-        # of 90, 180, and 270 degrees. 360 is not a factor because it gets auto-
-        # corrected to 0 when the object is created.
-        #
-        # Whether 10 decimal places is sufficient, I will leave to others to
-        # decide. --Neal
-        #
         # This method incorporates the windspeed in its calculations. If there's another application
         # that warrants producing Cartesian coordinates for the pure wind heading sans windspeed,
         # then writing another method would likely be appropriate.
-        north = speed * round(math.cos(direction_radians), 10)
-        east = speed * round(math.sin(direction_radians), 10)
+        north = speed * _COS_TABLE[self.direction]
+        east = speed * _SIN_TABLE[self.direction]
         return north, east
+
+
+# Wind directions are whole degrees in [0, 360), so we compute the trigonometry once for each.
+#
+# Rounding is to compensate for floating point error at wind headings
+# of 90, 180, and 270 degrees. 360 is not a factor because it gets auto-
+# corrected to 0 when the object is created.
+#
+# Whether 10 decimal places is sufficient, I will leave to others to
+# decide. --Neal
+_COS_TABLE = tuple(round(math.cos(math.radians(d)), 10) for d in range(360))
+_SIN_TABLE = tuple(round(math.sin(math.radians(d)), 10) for d in range(360))
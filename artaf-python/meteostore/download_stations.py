@@ -4,8 +4,9 @@ analysis, stored in config/stations.csv. You can update this list at any later t
 from this script"""
 
 import csv
-import re
+import json
 import sys
+from operator import attrgetter
 
 import requests
 
@@ -23,16 +24,22 @@ def download_taf_stations(): # pragma: no cover
     request_result = requests.get(request_url, timeout=60)
     request_result.raise_for_status()
 
-    json_result = request_result.json()
+    # json.loads() takes the raw bytes and detects the UTF flavor itself, which spares us
+    # requests' character set guessing on a sizable payload
+    json_result = json.loads(request_result.content)
 
-    station_regexp = re.compile(r"\d{12}-([A-Z]{4})-[A-Z]{4}\d{2}-TAF([A-Z]{3})(-[A-Z]{3})?")
+    # Product IDs look like 202401010000-KLOT-FTUS43-TAFORD, so the issuing center sits at a
+    # fixed position
+    assert all(len(x["product_id"]) >= 18 and x["product_id"][12] == "-"
+               and x["product_id"][13:17].isalpha() and x["product_id"][17] == "-"
+               for x in json_result["data"])
 
     # Station names have inconsistent capitalization. Most are uppercase but some
     # are not. We just make all of them uppercase for consistency.
     result = [StationDesc(x["station"], x["name"].upper(), x["lat"], x["lon"],
-                          station_regexp.fullmatch(x["product_id"]).group(1))
+                          x["product_id"][13:17])
               for x in json_result["data"]]
-    result.sort(key=lambda x: x.station)
+    result.sort(key=attrgetter("station"))
 
     # The number of stations shouldn't change drastically. At the time of this being
     # written it was 713.
@@ -40,7 +47,7 @@ def download_taf_stations(): # pragma: no cover
 
     # If KORD isn't in the dataset, then O'Hare has closed or got renamed, which
     # is unlikely.
-    assert "KORD" in (x.station for x in result)
+    assert "KORD" in {x.station for x in result}
 
     return result
 
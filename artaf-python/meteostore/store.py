@@ -1,21 +1,50 @@
 """This is the main functionality of meteostore, downloading, storing, and retrieving TAFs."""
+import atexit
+import collections
+import concurrent.futures
 import contextlib
 import datetime
+import errno
+import io
+import itertools
+import mmap
 import os
 import os.path
-import re
+import shutil
+import struct
+import sys
 import tempfile
 import zipfile
 from collections import namedtuple
+from operator import attrgetter
 
-import pytz
 import requests
+import requests.adapters
+from urllib3.util import Retry
 
-from artaf_util import safe_open_write
+import artaf_util
 from meteostore import util
 
 DATA_PATH = os.path.join("data", "raw")
 
+# How many downloads from Iowa State we run at the same time
+DOWNLOAD_WORKERS = 8
+
+# Chunk size for streaming downloads
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# How large a download we keep in memory before it spills to a temporary file
+SPOOL_SIZE = 1 << 22
+
+# How many stations we download before saving our progress to the yearly archive
+CHECKPOINT_STATIONS = 64
+
+# Buffer size for reading archives
+READ_BUFFER_SIZE = 1 << 20
+
+# How many TAFs we read at a time from a station's archive
+DEFAULT_BATCH_SIZE = 1024
+
 
 def cleanup_datetime(d):
     """
@@ -24,19 +53,20 @@ def cleanup_datetime(d):
     :param d: input date, a datetime.date or naive datetime.datetime
     :return: naive datetime.datetime
     """
-    for a in ["year", "month", "day"]:
-        if not hasattr(d, a):
-            raise AttributeError("I need at least a date with year, month, day.")
-    if hasattr(d, "tzinfo") and d.tzinfo is not None:
-        raise ValueError("I need a naive UTC date without timezone information.")
-    if hasattr(d, "hour"):
-        return datetime.datetime(d.year, d.month, d.day, d.hour, d.minute)
-    return datetime.datetime(d.year, d.month, d.day)
+    # datetime is a subclass of date, so it needs to be checked first
+    if isinstance(d, datetime.datetime):
+        if d.tzinfo is not None:
+            raise ValueError("I need a naive UTC date without timezone information.")
+        return d.replace(second=0, microsecond=0)
+    if isinstance(d, datetime.date):
+        return datetime.datetime(d.year, d.month, d.day)
+    raise AttributeError("I need at least a date with year, month, day.")
 
 
 # No unit testing since the one major risk is a change in the Web service itself
-def get_iowa_state_nws_archive(pil, start_time, end_time, center=None,
-                               fmt="text"):  # pragma: no cover
+def get_iowa_state_nws_archive(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        pil, start_time, end_time, center=None, fmt="text", session=None,
+        out_file=None):  # pragma: no cover
     """
     Download a NWS weather product from the Iowa Environmental Mesonet archive at Iowa State.
     :param pil: NWS PIL
@@ -46,8 +76,11 @@ def get_iowa_state_nws_archive(pil, start_time, end_time, center=None,
     :param center: Can be used to specify the desired center if the same PIL gets published by more
     than one.
     :param fmt: Can be "text", "html", or "zip", for the desired output format.
-    :return: The downloaded weather product, as a string for text or html formats and as bytes for
-    zip format.
+    :param session: A requests.Session to use rather than the module's shared one
+    :param out_file: If given for zip format, a binary file to stream the product into rather than
+    holding all of it in memory
+    :return: The downloaded weather product, as a string for text or html formats and as bytes
+    for zip format, or None if it went to out_file.
     """
 
     start_time = cleanup_datetime(start_time)
@@ -64,19 +97,42 @@ def get_iowa_state_nws_archive(pil, start_time, end_time, center=None,
     if center:
         params["center"] = center
 
-    r = requests.get(base_url, params, timeout=60)
-    r.raise_for_status()
+    with (session or _SESSION).get(base_url, params=params, timeout=60, stream=True) as r:
+        r.raise_for_status()
+
+        if fmt in ["text", "html"]:
+            return r.content.decode(r.encoding)
+        if out_file is not None:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                out_file.write(chunk)
+            return None
+        return r.content
+
+
+def _make_session():  # pragma: no cover
+    """
+    Make a requests session for downloading from Iowa State, keeping connections alive for as
+    many workers as we run and retrying on transient server trouble
+    :return: The session
+    """
+    session = requests.Session()
+    session.headers["Accept-Encoding"] = "gzip"
+    retries = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS,
+                                                            max_retries=retries))
+    return session
+
 
-    if fmt in ["text", "html"]:
-        return r.content.decode(r.encoding)
-    return r.content
+# One session for all our downloads, so that connections stay alive from one call to the next
+_SESSION = _make_session()
+atexit.register(_SESSION.close)
 
 
 def ensure_stations_years_sane(stations, from_year, to_year):
     """
     Make sure that we can download for a given set of stations and years as far as obvious
     sanity checks go.
-    :param stations: List of stations as StationDesc tuples
+    :param stations: List of stations as StationDesc objects
     :param from_year: Year from which to download, inclusive
     :param to_year: Year to which to download, inclusive
     :return:
@@ -85,11 +141,12 @@ def ensure_stations_years_sane(stations, from_year, to_year):
     from_year = int(from_year)
     to_year = int(to_year)
     assert from_year <= to_year
-    utcnow = datetime.datetime.now().astimezone(pytz.utc).replace(tzinfo=None)
+    utcnow = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
     if datetime.date(to_year + 1, 1, 3) > utcnow.date():
         raise IndexError("I can only download a yearly archive once the year is over.")
     # Make sure stations are sane
-    station_codes = [(s.station, s.center) for s in stations]
+    # There are only so many stations and centers, and we look them up in archives again and again
+    station_codes = [(sys.intern(s.station), sys.intern(s.center)) for s in stations]
     for station, center in station_codes:
         assert len(station) == 4 and station.isalpha() and station.isupper()
         assert len(center) == 4 and center.isalpha() and center.isupper()
@@ -98,61 +155,192 @@ def ensure_stations_years_sane(stations, from_year, to_year):
 
 # No coverage testing since the main risk is changes in the Web service itself and we don't
 # want to make permanent requests for testing
-def _prepare_taf_download(  # pylint: disable=too-many-arguments,too-many-positional-arguments
-        station_codes, file_path, tmp_dir_path, tmp_file_path, force_refresh,
-        read_only):  # pragma: no cover
-    """A helper function for download_tafs() to recover from a possible previous failed download
-    and to create and clean up the directory structure"""
+def _prepare_taf_download(station_codes, file_path, backup_path, force_refresh,
+                          read_only):  # pragma: no cover
+    """A helper function for download_tafs() to recover from a possible previous failed download.
+    Returns the station codes that the archive is still missing, if any."""
     if force_refresh and read_only:
         raise ValueError("I can't simultaneously do force_refresh and read_only.")
-    if os.path.exists(file_path) and force_refresh:
-        os.unlink(file_path)
-    if os.path.exists(tmp_file_path):
-        os.unlink(tmp_file_path)
-    if os.path.exists(file_path):
-        # If the output file exists and is complete, we're done
-        with zipfile.ZipFile(file_path, "r") as old_zip_file:
-            if set(old_zip_file.namelist()) >= set((s + ".zip" for s, _ in station_codes)):
-                return True
-            if read_only:
-                raise FileNotFoundError("I do not have complete TAFs cached, but was asked to run "
-                                        "read-only")
-            # If the output file already exists but is incomplete, we'll have to recover
-            # We expand the files into the temporary directory
-            if not os.path.exists(tmp_dir_path):
-                os.mkdir(tmp_dir_path)
-            for sub_file in old_zip_file.namelist():
-                with open(os.path.join(tmp_dir_path, sub_file), "wb") as out_file, \
-                        old_zip_file.open(sub_file, "r") as in_file:
-                    out_file.write(in_file.read())
-    # Ensure temporary directory exists and is clear of temporary files
-    if not os.path.exists(tmp_dir_path):
-        os.mkdir(tmp_dir_path)
-    for filename in os.listdir(tmp_dir_path):
-        if filename.endswith("~"):
-            os.unlink(os.path.join(tmp_dir_path, filename))
-    return False
+    if read_only:
+        # Another process may be adding stations to the archive right now, so we leave it alone
+        if os.path.exists(backup_path):
+            raise FileNotFoundError("I found an unfinished download of TAFs, but was asked to "
+                                    "run read-only")
+    else:
+        _clean_up_taf_download(file_path, backup_path, force_refresh)
+    if not os.path.exists(file_path):
+        return list(station_codes)
+    # We read the archive's directory once and work out from that what we're missing, if anything
+    with zipfile.ZipFile(file_path, "r") as old_zip_file:
+        archived_names = frozenset(old_zip_file.namelist())
+    missing_codes = [(station, center) for station, center in station_codes
+                     if station + ".zip" not in archived_names]
+    if missing_codes and read_only:
+        raise FileNotFoundError("I do not have complete TAFs cached, but was asked to run "
+                                "read-only")
+    # If the output file already exists but is incomplete, we'll add to it what's missing
+    return missing_codes
+
+
+def _clean_up_taf_download(file_path, backup_path, force_refresh):
+    """A helper function for download_tafs() to get rid of what a previous failed download may
+    have left behind, and of the old archive if we're to start over"""
+    if force_refresh:
+        for stale_path in (file_path, backup_path):
+            if os.path.exists(stale_path):
+                os.unlink(stale_path)
+    if os.path.exists(backup_path):
+        # We got interrupted while adding stations to the archive, so its end may be torn
+        _restore_archive_directory(file_path, backup_path)
+    # Earlier versions added stations to a working copy of the archive, and safe_open_write()
+    # leaves its new file behind if interrupted; we start over without any of them
+    for stale_path in (file_path + "~", backup_path + "~"):
+        if os.path.exists(stale_path):
+            os.unlink(stale_path)
+    # Earlier versions staged station files in a directory next to the archive; if one got left
+    # behind by an interrupted download, its contents are of no more use to us
+    shutil.rmtree(os.path.splitext(file_path)[0] + "~", ignore_errors=True)
+
+
+def _restore_archive_directory(file_path, backup_path):
+    """A helper function for download_tafs() to put back the end of a yearly archive as
+    _back_up_archive_directory() saved it, dropping whatever got written after it"""
+    with open(backup_path, "rb") as backup_file:
+        start_dir, = struct.unpack("<Q", backup_file.read(8))
+        with open(file_path, "r+b") as archive_file:
+            archive_file.seek(start_dir)
+            shutil.copyfileobj(backup_file, archive_file, READ_BUFFER_SIZE)
+            archive_file.truncate()
+            _sync_archive(archive_file)
+    os.unlink(backup_path)
+
+
+def _back_up_archive_directory(archive_file, start_dir, backup_path):
+    """A helper function for download_tafs() to durably save the end of a yearly archive from
+    its central directory on, which is all that appending to the archive overwrites"""
+    archive_file.seek(start_dir)
+    with artaf_util.safe_open_write(backup_path, "wb") as backup_file:
+        backup_file.write(struct.pack("<Q", start_dir))
+        shutil.copyfileobj(archive_file, backup_file, READ_BUFFER_SIZE)
+
+
+def _sync_archive(archive_file):
+    """Make sure whatever we wrote to a yearly archive has reached the disk"""
+    archive_file.flush()
+    os.fsync(archive_file.fileno())
+
+
+def _open_archive_file(file_path):
+    """A helper function for download_tafs() to open the yearly archive for adding stations to it
+    in place, creating an empty one first if there is none yet"""
+    if not os.path.exists(file_path):
+        with (artaf_util.safe_open_write(file_path, "wb") as new_file,
+              zipfile.ZipFile(new_file, "w")):
+            pass
+    # pylint: disable-next=consider-using-with
+    return open(file_path, "r+b")
+
+
+def _append_to_archive(archive_file, backup_path, compression):
+    """A helper function for download_tafs() to start adding stations to the open yearly archive,
+    after backing up its directory so that an interruption can't leave it torn"""
+    # The station files are compressed already, so by default we just store them. ZIP as
+    # delivered from Iowa State is horribly inefficient for many small files, though, so ZIP_LZMA
+    # still buys a good deal of disk space for a lot of CPU time if that is what you'd rather
+    # spend.
+    # pylint: disable-next=consider-using-with
+    zip_file = zipfile.ZipFile(archive_file, "a", compression)
+    _back_up_archive_directory(archive_file, zip_file.start_dir, backup_path)
+    return zip_file
+
+
+def _checkpoint_archive(zip_file, archive_file, backup_path, compression):
+    """A helper function for download_tafs() to make the stations downloaded so far permanent
+    in the yearly archive and to go on adding to it"""
+    zip_file.close()
+    _sync_archive(archive_file)
+    return _append_to_archive(archive_file, backup_path, compression)
+
+
+def _finish_archive(zip_file, archive_file, backup_path):
+    """A helper function for download_tafs() to make all stations added to the yearly archive
+    permanent, after which we no longer need the backup of its directory"""
+    zip_file.close()
+    _sync_archive(archive_file)
+    os.unlink(backup_path)
+
+
+# No coverage testing since the main risk is changes in the Web service itself and we don't
+# want to make permanent requests for testing
+def _download_station_year(session, station, pil, center, year_range):  # pragma: no cover
+    """A helper function for download_tafs() to download the TAFs for one station and year.
+    This runs in worker threads. Returns the station and a file holding the download."""
+    year_start, year_end = year_range
+    # Most downloads are small enough to keep in memory, but we don't want to hold a handful of
+    # big ones at the same time
+    # pylint: disable-next=consider-using-with
+    spool_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    try:
+        get_iowa_state_nws_archive(pil,
+                                   year_start,
+                                   year_end,
+                                   center=center,
+                                   fmt="zip",
+                                   session=session,
+                                   out_file=spool_file)
+        spool_file.seek(0)
+    except BaseException:
+        spool_file.close()
+        raise
+    return station, spool_file
 
 
 # No coverage testing since the main risk is changes in the Web service itself and we don't
 # want to make permanent requests for testing
-def _finish_download(year, file_path, tmp_dir_path, tmp_file_path):  # pragma: no cover
-    """A helper function for download_tafs() to package up downloaded data and clean up after
-    itself"""
-    # Now we collect the temporary directory into a ZIP file -- normally we don't compress
-    # collections of compressed files, but it turns out that ZIP as delivered from Iowa State is
-    # horribly inefficient for many small files. At the same time, I don't want to modify the
-    # original files. Thus, we just compress them again. This may take a little while.
-    print(f"\rPackaging TAFs for {year}...          ", end="", flush=True)
-    with zipfile.ZipFile(tmp_file_path, "w", zipfile.ZIP_LZMA) as new_zip_file:
-        for filename in sorted(os.listdir(tmp_dir_path)):
-            with open(os.path.join(tmp_dir_path, filename), "rb") as in_file:
-                new_zip_file.writestr(filename, in_file.read())
-    os.rename(tmp_file_path, file_path)
-    # Now we can get rid of the temporary directory
-    for filename in os.listdir(tmp_dir_path):
-        os.unlink(os.path.join(tmp_dir_path, filename))
-    os.rmdir(tmp_dir_path)
+def _download_year(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        session, year, missing_codes, file_path, backup_path,
+        compression):  # pragma: no cover
+    """A helper function for download_tafs() to download the given stations for one year
+    straight into the yearly archive. Returns the number of stations downloaded."""
+    # pylint: disable=too-many-locals
+    new_downloads = 0
+    # These are the same for all stations, so we only work them out once
+    year_range = (datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1))
+    pils = [(station, "TAF" + station[-3:], center) for station, center in missing_codes]
+    with _open_archive_file(file_path) as archive_file:
+        new_zip_file = _append_to_archive(archive_file, backup_path, compression)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(DOWNLOAD_WORKERS) as executor:
+                futures = [executor.submit(_download_station_year, session, station, pil, center,
+                                           year_range)
+                           for station, pil, center in pils]
+                try:
+                    # ZipFile isn't thread safe, so only this thread writes to it
+                    for future in concurrent.futures.as_completed(futures):
+                        station, spool_file = future.result()
+                        with (spool_file,
+                              new_zip_file.open(station + ".zip", "w") as station_file):
+                            shutil.copyfileobj(spool_file, station_file, READ_BUFFER_SIZE)
+                        new_downloads += 1
+                        print(f"\rDownloaded {station} TAFs for {year}...", end="", flush=True)
+                        # Every so often, we save our progress in case we get interrupted
+                        if new_downloads % CHECKPOINT_STATIONS == 0 \
+                                and new_downloads < len(futures):
+                            new_zip_file = _checkpoint_archive(new_zip_file, archive_file,
+                                                               backup_path, compression)
+                finally:
+                    # If something went wrong, don't go on downloading for nothing
+                    for future in futures:
+                        future.cancel()
+        except BaseException:
+            # If we got interrupted while writing a station, closing the ZipFile enters what we
+            # have of it into the directory all the same, so we go back to the last checkpoint
+            new_zip_file.close()
+            archive_file.close()
+            _restore_archive_directory(file_path, backup_path)
+            raise
+        _finish_archive(new_zip_file, archive_file, backup_path)
+    return new_downloads
 
 
 # No coverage since this downloads a gigabyte of data
@@ -185,26 +373,24 @@ def download_zenodo_taf_collection():  # pragma: no cover
                 print(f"\rExtracting {stripped_name}...", end="", flush=True)
                 with (zip_in.open(name, "r") as in_file,
                       open(os.path.join(DATA_PATH, stripped_name), "wb") as out_file):
-                    while True:
-                        chunk = in_file.read(65536)
-                        if not chunk:
-                            break
-                        out_file.write(chunk)
+                    shutil.copyfileobj(in_file, out_file, READ_BUFFER_SIZE)
         print("\rExtracting done.                          ")
 
 
 # No coverage testing since the main risk is changes in the Web service itself and we don't
 # want to make permanent requests for testing
-def download_tafs(  # pylint: disable=too-many-locals
+def download_tafs(  # pylint: disable=too-many-locals,too-many-arguments
         stations, from_year, to_year, force_refresh=False,
-        read_only=False):  # pragma: no cover
+        read_only=False, *, compression=zipfile.ZIP_STORED):  # pragma: no cover
     """
     Download all TAFs not yet loaded into our data cache.
-    :param stations: List of stations as StationDesc tuples
+    :param stations: List of stations as StationDesc objects
     :param from_year: Year from which to download, inclusive
     :param to_year: Year to which to download, inclusive
     :param force_refresh: If true, delete old datastore files
     :param read_only: Only ensure there's nothing to download, raise exception if there is
+    :param compression: One of the compression constants of the zipfile module for packaging
+    newly downloaded yearly archives, e.g., zipfile.ZIP_LZMA
     """
     station_codes, from_year, to_year = ensure_stations_years_sane(stations, from_year, to_year)
 
@@ -215,99 +401,293 @@ def download_tafs(  # pylint: disable=too-many-locals
 
     new_downloads = 0
 
+    # Downloads are independent and mostly spent waiting on the network, so we run several at a
+    # time, sharing one session to keep connections alive
     for year in range(from_year, to_year + 1):
         file_path = os.path.join(DATA_PATH, "TAF" + str(year) + ".zip")
-        tmp_dir_path = os.path.join(DATA_PATH, "TAF" + str(year) + "~")
-        tmp_file_path = file_path + "~"
+        backup_path = file_path + ".directory~"
 
-        if _prepare_taf_download(station_codes, file_path, tmp_dir_path, tmp_file_path,
-                                 force_refresh, read_only):
+        # Download TAFs for all the stations we don't already have
+        missing_codes = _prepare_taf_download(station_codes, file_path, backup_path,
+                                              force_refresh, read_only)
+        if not missing_codes:
             # We're already done
             continue
-
-        # Download TAFs for all the stations we don't already have
-        for station, center in station_codes:
-            # This means quite a few open and close operations, but we want to
-            sub_file_name = station + ".zip"
-            if os.path.exists(os.path.join(tmp_dir_path, sub_file_name)):
-                continue
-
-            print(f"\rDownloading {station} TAFs for {year}...", end="", flush=True)
-            data = get_iowa_state_nws_archive("TAF" + station[-3:],
-                                              datetime.date(year, 1, 1),
-                                              datetime.date(year + 1, 1, 1),
-                                              center=center,
-                                              fmt="zip")
-            with safe_open_write(os.path.join(tmp_dir_path, sub_file_name), "wb") as out_file:
-                out_file.write(data)
-
-            new_downloads += 1
-
-        _finish_download(year, file_path, tmp_dir_path, tmp_file_path)
+        new_downloads += _download_year(_SESSION, year, missing_codes, file_path,
+                                        backup_path, compression)
 
     if new_downloads:
         print(f"\rDownloaded {new_downloads} missing TAFs from Iowa State.         ")
 
 
-_taf_file_re = re.compile(r"TAF[A-Z]{3}_(\d{4})(\d{2})(\d{2})(\d{2})(\d{2}).txt")
+def _parse_taf_file_name(file_name):
+    """
+    Get the issue time from the name of a TAF file in the archive, such as
+    TAFORD_202401010520.txt. The names have a fixed layout, so we just slice them.
+    :param file_name: The file name
+    :return: The issue time as a naive datetime in UTC
+    """
+    if not (len(file_name) == 23 and file_name.startswith("TAF") and file_name[6] == "_"
+            and file_name.endswith(".txt")):
+        raise ValueError(f"Unexpected TAF file name '{file_name}'")
+    return datetime.datetime(int(file_name[7:11]), int(file_name[11:13]), int(file_name[13:15]),
+                             int(file_name[15:17]), int(file_name[17:19]))
 
+# text is a str, or bytes if get_tafs() was asked not to decode
 TimeTafRecord = namedtuple("TimeTafRecord", ["time", "text"])
 
 
+class _ViewReader(io.RawIOBase):
+    """A read-only file over a memoryview, so that we can read a range of a memory map as a file
+    without copying it out first"""
+
+    def __init__(self, view):
+        super().__init__()
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        """We can be read"""
+        return True
+
+    def seekable(self):
+        """We can seek"""
+        return True
+
+    def tell(self):
+        """Get the current position"""
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Go to a position, counting from the start, the current position, or the end"""
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        if position < 0:
+            # That's what real files raise, and what zipfile expects for entries too short to be
+            # ZIP files
+            raise OSError(errno.EINVAL, "Invalid argument")
+        self._position = position
+        return position
+
+    def read(self, size=-1):
+        """Read up to size bytes, or everything that's left, copying only what we read"""
+        end = len(self._view) if size is None or size < 0 else self._position + size
+        data = bytes(self._view[self._position:end])
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        """Read into a buffer we're given"""
+        data = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+@contextlib.contextmanager
+def _open_station_zip(data_file, data_map, station):
+    """
+    Open the inner ZIP file of one station within a yearly archive
+    :param data_file: The yearly archive as a ZipFile
+    :param data_map: A read-only memory map of the yearly archive
+    :param station: The station whose TAFs we want
+    :return: A context manager giving the inner ZipFile
+    """
+    info = data_file.getinfo(station.station + ".zip")
+    # The entry's data starts after the local file header, whose name and extra field lengths may
+    # differ from the central directory's
+    header_start = info.header_offset
+    if data_map[header_start:header_start + 4] != b"PK\x03\x04":
+        raise zipfile.BadZipFile(f"Bad local file header for {info.filename}")
+    name_length, extra_length = struct.unpack_from("<HH", data_map, header_start + 26)
+    data_start = header_start + 30 + name_length + extra_length
+    _advise_will_need(data_file, data_map, header_start, data_start + info.compress_size)
+    if info.compress_type == zipfile.ZIP_STORED:
+        # A stored entry is just a range of bytes in the yearly archive, which we can take
+        # straight from the memory map. The memory map can't be closed while the view is around,
+        # so we let go of it as soon as we're done
+        with (memoryview(data_map)[data_start:data_start + info.compress_size] as entry_view,
+              zipfile.ZipFile(_ViewReader(entry_view), "r") as inner_zip):
+            yield inner_zip
+    else:
+        # Reading the inner ZIP takes many small reads, each of which would otherwise go through
+        # the outer ZIP's decompressor, so we buffer them
+        with (data_file.open(info, "r") as raw_inner_file,
+              io.BufferedReader(raw_inner_file, buffer_size=READ_BUFFER_SIZE) as inner_file,
+              zipfile.ZipFile(inner_file, "r") as inner_zip):
+            yield inner_zip
+
+
 # noinspection PyShadowingNames
-def _get_tafs_station(station, data_files):
+def _get_tafs_station_batched(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        station, data_files, data_maps, batch_size, decode, raw):
     """
-    A helper function for get_tafs that returns a generator of TimeTafRecords for the
-    given station and years. Should not be called outside of get_tafs().
+    A helper function for get_tafs that returns a generator of lists of up to batch_size
+    TimeTafRecords for the given station and years. Should not be called outside of get_tafs().
     :param station: The station for which records are to be returned
     :param data_files: A dictionary of years and the corresponding ZIP files
+    :param data_maps: A dictionary of years and memory maps of the corresponding ZIP files
+    :param batch_size: The largest number of records in one list
+    :param decode: Whether to decode the TAF texts to str or leave them as bytes
+    :param raw: Whether to give plain tuples rather than TimeTafRecords
     """
     previous_taf_date = None
-    for data_file in data_files.values():
-        with data_file.open(station.station + ".zip", "r") as inner_file:
-            with zipfile.ZipFile(inner_file, "r") as inner_zip:
-                for file_name in sorted(inner_zip.namelist()):
-                    match = _taf_file_re.fullmatch(file_name)
-                    date_parts = [int(x) for x in match.groups()]
-                    taf_date = datetime.datetime(date_parts[0], date_parts[1], date_parts[2],
-                                                 date_parts[3], date_parts[4])
-                    # There is an oddity in Iowa State's archives whereby a few files are
-                    # included twice
-                    if taf_date == previous_taf_date:
-                        continue
-                    assert previous_taf_date is None or taf_date > previous_taf_date
-                    previous_taf_date = taf_date
-                    taf_content = inner_zip.read(file_name).decode("ascii")
-                    yield TimeTafRecord(taf_date, taf_content)
+    batch = []
+    for year, data_file in data_files.items():
+        # The files get closed through the with statements in _open_station_zip() even if we're
+        # closed before we're exhausted
+        with _open_station_zip(  # pylint: disable=contextmanager-generator-missing-cleanup
+                data_file, data_maps[year], station) as inner_zip:
+            # Going by ZipInfo objects saves looking up each entry by name again to read it
+            for info in sorted(inner_zip.infolist(), key=attrgetter("filename")):
+                taf_date = _parse_taf_file_name(info.filename)
+                # There is an oddity in Iowa State's archives whereby a few files are
+                # included twice
+                if taf_date == previous_taf_date:
+                    continue
+                assert previous_taf_date is None or taf_date > previous_taf_date
+                previous_taf_date = taf_date
+                taf_content = inner_zip.read(info)
+                if decode:
+                    taf_content = taf_content.decode("ascii")
+                if raw:
+                    batch.append((taf_date, taf_content))
+                else:
+                    batch.append(TimeTafRecord(taf_date, taf_content))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
 
 
 StationTafRecord = namedtuple("StationTafRecord", ["station", "tafs"])
 
 
+def _advise_will_need(data_file, data_map, start, end):
+    """
+    A helper function for get_tafs that tells the operating system we're about to read a range
+    of a yearly archive, so that it reads all of it ahead at once. We only read the stations we
+    were asked for, so we leave the rest of the archive alone.
+    :param data_file: The yearly archive as a ZipFile
+    :param data_map: A memory map of the yearly archive
+    :param start: Where the range starts
+    :param end: Where the range ends, exclusive
+    """
+    # Not every platform has these, e.g., Windows doesn't
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(data_file.fp.fileno(), start, end - start, os.POSIX_FADV_WILLNEED)
+    if hasattr(mmap, "MADV_WILLNEED"):
+        # The range we advise on has to start at a page boundary
+        page_start = start - start % mmap.PAGESIZE
+        data_map.madvise(mmap.MADV_WILLNEED, page_start, end - page_start)
+
+
+def _open_data_files(stack, years):
+    """
+    A helper function for get_tafs that opens the yearly archives both as ZIP files and as
+    memory maps
+    :param stack: An ExitStack to close everything we open
+    :param years: The years whose archives to open
+    :return: Dictionaries of years and ZIP files, and of years and memory maps
+    """
+    # The stack we're given closes what we open
+    # pylint: disable=consider-using-with
+    data_files = {}
+    data_maps = {}
+    for year in years:
+        raw_file = stack.enter_context(
+            open(os.path.join(DATA_PATH, "TAF" + str(year) + ".zip"), "rb",
+                 buffering=READ_BUFFER_SIZE))
+        data_maps[year] = stack.enter_context(
+            mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ))
+        data_files[year] = stack.enter_context(zipfile.ZipFile(raw_file, "r"))
+    return data_files, data_maps
+
+
+def _prefetch_stations(stations, prefetch, read_station):
+    """
+    A helper function for get_tafs that reads stations in worker threads ahead of the consumer.
+    Most of the reading is decompression and file access, which don't hold the GIL.
+    :param stations: A list of stations
+    :param prefetch: How many stations to read ahead
+    :param read_station: A function reading all TAFs of a station into a list of batches
+    :return: A generator of pairs of stations and their lists of batches
+    """
+    with concurrent.futures.ThreadPoolExecutor(prefetch) as executor:
+        pending = collections.deque(
+            (a_station, executor.submit(read_station, a_station))
+            for a_station in stations[:prefetch])
+        next_index = len(pending)
+        try:
+            while pending:
+                a_station, future = pending.popleft()
+                if next_index < len(stations):
+                    pending.append((stations[next_index],
+                                    executor.submit(read_station, stations[next_index])))
+                    next_index += 1
+                yield a_station, future.result()
+        finally:
+            # If our consumer gives up early, don't go on reading for nobody
+            for _, future in pending:
+                future.cancel()
+
+
 # noinspection PyShadowingNames
-def get_tafs(stations, from_year, to_year, read_only=False):
+def get_tafs(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+        stations, from_year, to_year, read_only=False, batch_size=None, decode=True,
+        prefetch=0, raw=False):
     """
     Get TAFs for the given times and places from the store. Download if need be.
     The result is a generator of StationTafRecords which in turn contain
     generators of TimeTafRecords in their tafs field. Results are in chronological order
     for each station.
-    :param stations: A list of meteostore.StationDesc tuples
+    :param stations: A list of meteostore.StationDesc objects
     :param from_year: Year from which to serve data, inclusive
     :param to_year: Year to which to serve data, inclusive
     :param read_only Only read cached TAFs, raise exception if they're not in cache
+    :param batch_size: If given, the tafs fields generate lists of up to this many
+    TimeTafRecords rather than single ones, which saves consumers some overhead per record
+    :param decode: If false, TAF texts come as ASCII bytes rather than str, for consumers that
+    don't need them decoded
+    :param prefetch: If positive, read this many stations ahead in worker threads while the
+    consumer works on the current one. Each of them is held in memory in full.
+    :param raw: If true, TAFs come as plain (time, text) tuples rather than TimeTafRecords, which
+    are a little cheaper to make for consumers that just unpack them
     """
     stations = list(stations)
     download_tafs(stations, from_year, to_year, force_refresh=False, read_only=read_only)
-    years = list(range(from_year, to_year + 1))
     # ExitStack will provide context management for all the files we're opening, i.e., close them
     # for us once we're finished or raise and exception
     with contextlib.ExitStack() as stack:
-        data_files = {
-            year: stack.enter_context(
-                zipfile.ZipFile(os.path.join(DATA_PATH, "TAF" + str(year) + ".zip"), "r"))
-            for year in years}
+        data_files, data_maps = _open_data_files(stack, range(from_year, to_year + 1))
+        if prefetch:
+            def read_station(a_station):
+                return list(_get_tafs_station_batched(
+                    a_station, data_files, data_maps, batch_size or DEFAULT_BATCH_SIZE, decode,
+                    raw))
+
+            # The workers have to be done before the files they read from get closed
+            prefetched = stack.enter_context(contextlib.closing(
+                _prefetch_stations(stations, prefetch, read_station)))
+            for a_station, batches in prefetched:
+                tafs = iter(batches) if batch_size else itertools.chain.from_iterable(batches)
+                yield StationTafRecord(a_station, tafs)
+            return
         for a_station in stations:
-            yield StationTafRecord(a_station, _get_tafs_station(a_station, data_files))
+            batches = _get_tafs_station_batched(a_station, data_files, data_maps,
+                                                batch_size or DEFAULT_BATCH_SIZE, decode, raw)
+            # A station's TAFs may hold a view of a memory map, which can't be closed as long as
+            # they do, so we close them first even if our consumer hasn't finished with them
+            stack.callback(batches.close)
+            tafs = batches if batch_size else itertools.chain.from_iterable(batches)
+            yield StationTafRecord(a_station, tafs)
 
 
 if __name__ == "__main__":
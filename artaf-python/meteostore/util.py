@@ -1,22 +1,52 @@
 """Helper functions for meteostore."""
 
 import csv
+import dataclasses
+import functools
 import os.path
-from collections import namedtuple
+from operator import attrgetter
 
-StationDesc = namedtuple("StationDesc",
-                         ["station", "name", "latitude", "longitude", "center"])
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class StationDesc:
+    """An aerodrome for which TAFs are issued, and the center issuing them"""
+    station: str
+    name: str
+    latitude: float
+    longitude: float
+    center: str
 
 STATION_PATH = os.path.join("config", "stations.csv")
 
 
 def get_station_list():
     """
-    Get a list of stations to consider from the configuration file stations.csv.
-    :return: List of StationDesc tuples
+    Get a list of stations to consider from the configuration file stations.csv. The file only
+    gets read once, so the list comes from a cache after the first call.
+    :return: List of StationDesc objects
+    """
+    # We go by the absolute path in case the working directory changes in between
+    return list(_read_station_list(os.path.abspath(STATION_PATH)))
+
+
+@functools.lru_cache(maxsize=None)
+def _read_station_list(station_path):
+    """
+    Read the stations from a stations.csv file
+    :param station_path: The path of the file
+    :return: A tuple of StationDesc objects, sorted by station
     """
-    with open(STATION_PATH, "r", encoding="ascii") as station_file:
-        reader = csv.DictReader(station_file)
-        stations = sorted(reader, key=lambda r: r["station"])
-        return [StationDesc(l["station"], l["name"], l["latitude"], l["longitude"], l["center"])
-                for l in stations]
+    with open(station_path, "r", encoding="ascii", newline="") as station_file:
+        # A plain reader saves making a dict for every row; we look up the columns once
+        reader = csv.reader(station_file)
+        column = {name: index for index, name in enumerate(next(reader))}
+        station_column = column["station"]
+        name_column = column["name"]
+        latitude_column = column["latitude"]
+        longitude_column = column["longitude"]
+        center_column = column["center"]
+        return tuple(sorted((StationDesc(row[station_column], row[name_column],
+                                         float(row[latitude_column]), float(row[longitude_column]),
+                                         row[center_column])
+                             for row in reader),
+                            key=attrgetter("station")))
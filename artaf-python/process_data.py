@@ -1,7 +1,7 @@
 """ This is a script to run the data download and processing in logical order. It should
 be executed with the project directory as the working directory."""
 import argparse
-import collections
+import dataclasses
 import os
 import os.path
 
@@ -21,17 +21,26 @@ def get_config(config_name):
     :param config_name: Name of the configuration to be loaded
     :return: A dictionary with configuration parameters
     """
-    with open(CONFIG_PATH, "r", encoding="ascii") as config_file:
-        config_raw = yaml.safe_load(config_file)
+    # The YAML loader reads bytes itself, so we don't need to decode them first
+    with open(CONFIG_PATH, "rb") as config_file:
+        # PyYAML only comes with the much faster C loader if it was built against LibYAML
+        loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        config_raw = yaml.load(config_file, Loader=loader)
     config = config_raw["general"] if config_raw["general"] else {}
     if config_raw[config_name]:
         config.update(config_raw[config_name])
     return config
 
 
-RunConfig = collections.namedtuple(
-    "RunConfig",
-    ["stations", "year_from", "year_to", "config_name", "parallel"])
+@dataclasses.dataclass(slots=True, frozen=True)
+class RunConfig:
+    """What process_data() is to do, as given by the command line and configuration"""
+    stations: list
+    year_from: int
+    year_to: int
+    config_name: str
+    parallel: bool | str
+    fast_path: bool
 
 
 def process_arguments():  # pragma: no cover
@@ -48,13 +57,15 @@ def process_arguments():  # pragma: no cover
     year_from = config["year_from"]
     year_to = config["year_to"]
     parallel = config["parallel"]
+    fast_path = config["fast_path"]
     stations = meteostore.get_station_list()
     if "aerodromes" in config:
-        stations = list(filter(lambda station: station.station in config["aerodromes"], stations))
+        aerodromes = set(config["aerodromes"])
+        stations = [station for station in stations if station.station in aerodromes]
     print(f"Running in configuration {arguments.config} for years from {year_from} through "
           f"{year_to} with {len(stations)} aerodromes.")
     return RunConfig(stations=stations, year_from=year_from, year_to=year_to,
-                     config_name=config_name, parallel=parallel)
+                     config_name=config_name, parallel=parallel, fast_path=fast_path)
 
 
 def process_data():  # pragma: no cover
@@ -79,7 +90,8 @@ def process_data():  # pragma: no cover
         analyzer.DEFAULT_JOBS,
         os.path.join("data", "histograms", run_config.config_name),
         progress_callback=progress,
-        parallel=run_config.parallel)
+        parallel=run_config.parallel,
+        fast_path=run_config.fast_path)
     processor.process(run_config.stations, run_config.year_from, run_config.year_to)
     print(f"\rProcessed {processor.processed_hours:,} station hours, encountered "
           f"{processor.processed_errors:,} errors...")
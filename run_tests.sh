@@ -9,7 +9,7 @@ echo "*** Linting the Python code... ***"
 pylint test-artaf-python artaf-python
 
 echo "*** Running Python unit tests... ***"
-coverage run -m pytest
+coverage run -m pytest --network
 coverage html
 
 echo "*** Checking the Citation ***"
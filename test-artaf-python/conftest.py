@@ -0,0 +1,23 @@
+"""Shared pytest configuration. Tests that download from the network only run with --network."""
+import pytest
+
+
+def pytest_addoption(parser):
+    """Add the --network option"""
+    parser.addoption("--network", action="store_true", default=False,
+                     help="run tests that download data over the network")
+
+
+def pytest_configure(config):
+    """Register the network marker"""
+    config.addinivalue_line("markers", "network: test downloads data over the network")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip tests marked network unless we have been asked to run them"""
+    if config.getoption("--network"):
+        return
+    skip_network = pytest.mark.skip(reason="requires --network")
+    for item in items:
+        if "network" in item.keywords:
+            item.add_marker(skip_network)
@@ -1,13 +1,19 @@
 """Test analyzer.HourlyHistogramProcessor"""
+import collections
+import multiprocessing
 import os.path
 import zipfile
 
+import pytest
+
 import analyzer.analyzer
 import meteostore
+import meteostore.store
 from test_artaf_util import make_temp_directory
+from test_meteostore import ARCHIVE_YEARS, make_taf_archives
 
 
-class TestHourlyHistogramProcessor:  # pylint: disable=too-few-public-methods
+class TestHourlyHistogramProcessor:
     """Test analyzer.HourlyHistogramProcessor"""
 
     @staticmethod
@@ -17,43 +23,89 @@ class TestHourlyHistogramProcessor:  # pylint: disable=too-few-public-methods
         assert processed_tafs == int(processed_tafs)
         assert processed_hours == int(processed_hours)
 
-    def test_parallel(self):
-        """Really more of an integration test for the parallel processing mechanism.
-        Make sure that results are identical when processed in parallel and in one thread."""
+    @classmethod
+    def _process(cls, stations, year, output_directory, parallel):
+        """Process the first records of the given stations and year into output_directory. This
+        is a smoke test of the mechanism rather than a benchmark, so a few records will do."""
+        read_records = 100
+        processor = analyzer.analyzer.HourlyHistogramProcessor(
+            analyzer.jobs.DEFAULT_JOBS, output_directory,
+            parallel=parallel, progress_callback=cls._nada_callback)
+        processor.show_progress_after = read_records // 2
+        processor._abort_after = read_records + 1  # pylint: disable=protected-access
+        processor.process(stations, year, year)
+
+    @staticmethod
+    def _read_histogram(output_directory):
+        """Read the header and a multiset of the other lines of a histogram. The lines stream
+        from the ZIP file, and as the output is ASCII, we can count them without decoding them."""
+        with (zipfile.ZipFile(os.path.join(output_directory, "hist YearlyStations.csv.zip"),
+                              "r") as histogram_zip,
+              histogram_zip.open("hist YearlyStations.csv") as histogram_file):
+            header = histogram_file.readline()
+            return header, collections.Counter(histogram_file)
+
+    @pytest.fixture(scope="session")
+    @classmethod
+    def flat_histogram(cls, tmp_path_factory):
+        """Process in a single thread once, as the reference for every parallel variant"""
         stations = [s for s in meteostore.get_station_list() if s.station == "KENW"]
         year = 2023
-        read_records = 1000
         # If TAFs aren't here, download them as test data set
         meteostore.download_tafs(stations, year, year)
-        with make_temp_directory() as temp_directory:
-            # Process in a single thread
-            flat_temp_directory = os.path.join(temp_directory, "flat")
-            processor_flat = analyzer.analyzer.HourlyHistogramProcessor(
-                analyzer.jobs.DEFAULT_JOBS, flat_temp_directory,
-                parallel=False, progress_callback=self._nada_callback)
-            processor_flat.show_progress_after = read_records
-            processor_flat._abort_after = read_records + 1  # pylint: disable=protected-access
-            processor_flat.process(stations, year, year)
-
-            # Process parallel
-            parallel_temp_directory = os.path.join(temp_directory, "parallel")
-            processor_parallel = analyzer.analyzer.HourlyHistogramProcessor(
-                analyzer.jobs.DEFAULT_JOBS, parallel_temp_directory,
-                parallel=True, progress_callback=self._nada_callback)
-            processor_parallel.show_progress_after = read_records
-            processor_parallel._abort_after = read_records + 1  # pylint: disable=protected-access
-            processor_parallel.process(stations, year, year)
+        flat_temp_directory = str(tmp_path_factory.mktemp("flat"))
+        cls._process(stations, year, flat_temp_directory, parallel=False)
+        return stations, year, cls._read_histogram(flat_temp_directory)
 
+    @pytest.mark.network
+    @pytest.mark.parametrize("parallel", [True, "threads"])
+    def test_parallel(self, parallel, flat_histogram):
+        """Really more of an integration test for the parallel processing mechanism.
+        Make sure that results are identical when processed in parallel, in processes or in
+        threads, and in one thread."""
+        stations, year, (flat_header, flat_lines) = flat_histogram
+        with make_temp_directory() as temp_directory:
+            self._process(stations, year, temp_directory, parallel=parallel)
             # Ensure that records are identical other than order of lines
-            with (zipfile.ZipFile(os.path.join(flat_temp_directory, "hist YearlyStations.csv.zip"),
-                                  "r") as flat_zip,
-                  flat_zip.open("hist YearlyStations.csv") as flat_file):
-                flat_lines = flat_file.read().decode("ascii").split("\n")
-            with (zipfile.ZipFile(
-                    os.path.join(parallel_temp_directory, "hist YearlyStations.csv.zip"),
-                    "r") as parallel_zip,
-                parallel_zip.open("hist YearlyStations.csv") as parallel_file):
-                parallel_lines = parallel_file.read().decode("ascii").split("\n")
-            assert flat_lines[0] == parallel_lines[0]
-            assert len(flat_lines) == len(parallel_lines)
-            assert list(sorted(flat_lines[1:])) == list(sorted(parallel_lines[1:]))
+            parallel_header, parallel_lines = self._read_histogram(temp_directory)
+            assert flat_header == parallel_header
+            assert flat_lines == parallel_lines
+
+    def test_fast_path(self, tmp_path, monkeypatch):
+        """Parsing plain TAFs without Lark should make no difference to the results"""
+        data_directory = tmp_path / "data"
+        data_directory.mkdir()
+        monkeypatch.setattr(meteostore.store, "DATA_PATH", str(data_directory))
+        stations, _ = make_taf_archives(str(data_directory), zipfile.ZIP_STORED)
+        histograms = []
+        for fast_path in (False, True):
+            output_directory = str(tmp_path / f"fast_path {fast_path}")
+            processor = analyzer.analyzer.HourlyHistogramProcessor(
+                analyzer.jobs.DEFAULT_JOBS, output_directory, fast_path=fast_path)
+            processor.process(stations, *ARCHIVE_YEARS)
+            assert processor.processed_hours > 0
+            assert processor.processed_errors == 0
+            histograms.append(self._read_histogram(output_directory))
+        assert histograms[0] == histograms[1]
+
+    @pytest.mark.parametrize("parallel", [True, "threads"])
+    def test_parallel_offline(self, parallel, tmp_path, monkeypatch):
+        """Make sure that results are identical when processed in parallel, in processes or in
+        threads sharing one parser, and in one thread, on TAFs we make up so that this runs
+        without the network too"""
+        if parallel is True and multiprocessing.get_start_method() != "fork":
+            pytest.skip("Only forked worker processes see where we put the made-up TAFs")
+        data_directory = tmp_path / "data"
+        data_directory.mkdir()
+        monkeypatch.setattr(meteostore.store, "DATA_PATH", str(data_directory))
+        stations, _ = make_taf_archives(str(data_directory), zipfile.ZIP_STORED)
+        histograms = []
+        for a_parallel in (False, parallel):
+            output_directory = str(tmp_path / f"parallel {a_parallel}")
+            processor = analyzer.analyzer.HourlyHistogramProcessor(
+                analyzer.jobs.DEFAULT_JOBS, output_directory, parallel=a_parallel)
+            processor.process(stations, *ARCHIVE_YEARS)
+            assert processor.processed_hours > 0
+            assert processor.processed_errors == 0
+            histograms.append(self._read_histogram(output_directory))
+        assert histograms[0] == histograms[1]
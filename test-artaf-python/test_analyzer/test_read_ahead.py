@@ -0,0 +1,45 @@
+"""Test analyzer.analyzer.read_ahead"""
+import threading
+
+import pytest
+
+from analyzer.analyzer import read_ahead
+
+
+class TestReadAhead:
+    """Test reading ahead in a worker thread"""
+
+    def test_same_items(self):
+        """We should get the same items in the same order"""
+        assert list(read_ahead(range(100), 3)) == list(range(100))
+
+    def test_exception(self):
+        """An exception in the reader should reach the consumer"""
+
+        def failing_items():
+            yield 1
+            raise ValueError("Backing out...")
+
+        items = read_ahead(failing_items())
+        assert next(items) == 1
+        with pytest.raises(ValueError):
+            next(items)
+
+    def test_early_stop(self):
+        """Giving up early shouldn't leave the reader hanging or have it go on reading"""
+        max_queued = 2
+        read = []
+
+        def source():
+            for item in range(1000):
+                read.append(item)
+                yield item
+
+        threads_before = set(threading.enumerate())
+        items = read_ahead(source(), max_queued)
+        assert next(items) == 0
+        items.close()
+        assert set(threading.enumerate()) <= threads_before
+        # Besides what we got, the reader can only have read what fit in the queue and what it
+        # was trying to put there when we gave up
+        assert len(read) <= 1 + max_queued + 1
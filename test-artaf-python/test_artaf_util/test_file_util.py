@@ -1,37 +1,40 @@
 """Test artaf_util.file_util"""
 import os.path
+import pathlib
 import tempfile
 import zipfile
-from contextlib import contextmanager
 
 import pytest
 
 import artaf_util
 
-
-def _delete_recursive(directory_path):
-    for f in os.listdir(directory_path):
-        file_path = os.path.join(directory_path, f)
-        if os.path.isdir(file_path):
-            _delete_recursive(file_path)
-            # On some operating systems, we can't delete this manually, but it will be taken care
-            # of for us
-            try:
-                os.rmdir(file_path)
-            except PermissionError:  # pragma: no cover
-                pass
-        else:
-            os.unlink(file_path)
+TEST_CONTENT = "Hello world!\n"
+# What the content looks like on disk, so we can compare without decoding
+TEST_CONTENT_BYTES = TEST_CONTENT.encode("ascii")
 
 
-@contextmanager
 def make_temp_directory():
     """Make a temporary directory and delete it"""
-    temp_dir = tempfile.mkdtemp()
-    try:
-        yield temp_dir
-    finally:
-        _delete_recursive(temp_dir)
+    # On some operating systems, we can't delete everything manually, but it will be taken care
+    # of for us
+    return tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+
+
+class TestReplaceDurably:  # pylint: disable=too-few-public-methods
+    """Test artaf_util.replace_durably()"""
+
+    def test_replace_existing(self):
+        """A new file should take the place of an existing one"""
+        with make_temp_directory() as temp_dir:
+            file_name = os.path.join(temp_dir, "testfile.txt")
+            new_file_name = file_name + "~"
+            with open(file_name, "w", encoding="ascii") as out_file:
+                out_file.write("Old content\n")
+            with open(new_file_name, "w", encoding="ascii") as out_file:
+                out_file.write("New content\n")
+            artaf_util.replace_durably(new_file_name, file_name)
+            assert not os.path.exists(new_file_name)
+            assert pathlib.Path(file_name).read_text(encoding="ascii") == "New content\n"
 
 
 class TestSafeOpenWrite:
@@ -40,20 +43,17 @@ class TestSafeOpenWrite:
     def test_successful_write(self):
         """Test a successful write operation"""
         with make_temp_directory() as temp_dir:
-            test_content = "Hello world!\n"
             temp_file_name = os.path.join(temp_dir, "testfile.txt")
             with artaf_util.safe_open_write(temp_file_name, "w") as out_file:
-                out_file.write(test_content)
-            with open(temp_file_name, "r", encoding="ascii") as in_file:
-                assert in_file.read() == test_content
+                out_file.write(TEST_CONTENT)
+            assert pathlib.Path(temp_file_name).read_bytes() == TEST_CONTENT_BYTES
 
     def test_failed_write(self):
         """Test an unsuccessful write operation interrupted by an exception"""
         with make_temp_directory() as temp_dir:
-            test_content = "Hello world!\n"
             temp_file_name = os.path.join(temp_dir, "testfile.txt")
             with open(temp_file_name, "w", encoding="ascii") as out_file:
-                out_file.write(test_content)
+                out_file.write(TEST_CONTENT)
             try:
                 with artaf_util.safe_open_write(temp_file_name, "w", encoding="ascii") as out_file:
                     out_file.write("ERROR CONTENT")
@@ -62,8 +62,7 @@ class TestSafeOpenWrite:
             except ValueError:
                 pass
             # We should still have the original file content
-            with open(temp_file_name, "r", encoding="ascii") as in_file:
-                assert in_file.read() == test_content
+            assert pathlib.Path(temp_file_name).read_bytes() == TEST_CONTENT_BYTES
 
     def test_failed_read(self):
         """Test that we can't read from a file safely opened for writing"""
@@ -77,14 +76,18 @@ class TestSafeOpenWrite:
 class TestOpenCompressedZipWrite:  # pylint: disable=too-few-public-methods
     """Test artaf_util.pen_compressed_text_zip_write"""
 
-    def test_open_compressed_zip_write(self):
+    @pytest.mark.parametrize("compression,test_content", [
+        (zipfile.ZIP_STORED, TEST_CONTENT),
+        # Enough content for compression to actually do something
+        (zipfile.ZIP_DEFLATED, TEST_CONTENT * 5000),
+    ])
+    def test_open_compressed_zip_write(self, compression, test_content):
         """Test roundtrip for compressed text file"""
-        test_content = "Hello world!\n"
         with make_temp_directory() as temp_dir:
             temp_file_name = os.path.join(temp_dir, "test.csv.zip")
             inner_file_name = "test.csv"
             with artaf_util.safe_open_compressed_text_zip_write(
-                    temp_file_name, inner_file_name, "ascii", zipfile.ZIP_DEFLATED) as out_file:
+                    temp_file_name, inner_file_name, "ascii", compression) as out_file:
                 out_file.write(test_content)
             with zipfile.ZipFile(temp_file_name, "r") as in_zip_file:
                 the_bytes = in_zip_file.read(inner_file_name)
@@ -92,21 +95,19 @@ class TestOpenCompressedZipWrite:  # pylint: disable=too-few-public-methods
 
     def test_safe_failure(self):
         """Test safe failure for writing to a compressed text file"""
-        test_content = "Hello world!\n"
         with make_temp_directory() as temp_dir:
             temp_file_name = os.path.join(temp_dir, "test.txt")
             inner_file_name = "test.csv"
             # Successful file operation
             with open(temp_file_name, "w", encoding="ascii") as out_file:
-                out_file.write(test_content)
+                out_file.write(TEST_CONTENT)
             # Failed file operation
             try:
                 with artaf_util.safe_open_compressed_text_zip_write(
                         temp_file_name, inner_file_name, "ascii", zipfile.ZIP_DEFLATED) as out_file:
-                    out_file.write(test_content)
+                    out_file.write(TEST_CONTENT)
                     raise ValueError()
             except ValueError:
                 pass
             # Check that we still have everything
-            with open(temp_file_name, "r", encoding="ascii") as in_file:
-                assert in_file.read() == test_content
+            assert pathlib.Path(temp_file_name).read_bytes() == TEST_CONTENT_BYTES
@@ -1,6 +1,8 @@
 """Test meteoparse.regularize_tafs"""
 import datetime
 
+import pytest
+
 import meteoparse
 
 TEST_TAFS_NORMAL = [
@@ -82,37 +84,48 @@ TEST_TAFS_NIL = [
 class TestRegularizeTafs:
     """Test whether regularize_tafs properly arranges TAFs in hourly intervals"""
 
-    def test_regularize_tafs(self):
+    @pytest.fixture(scope="class")
+    @classmethod
+    def parsed_tafs(cls):
+        """Parse each of the test TAF lists only once for all tests. Tests mustn't modify them."""
+        return {name: tuple(meteoparse.parse_tafs(tafs)) for name, tafs in [
+            ("normal", TEST_TAFS_NORMAL),
+            ("error", TEST_TAFS_ERROR),
+            ("odd_start", TEST_TAFS_ODD_START),
+            ("nil", TEST_TAFS_NIL),
+        ]}
+
+    def test_regularize_tafs(self, parsed_tafs):
         """Test a boring case of properly aligned from lines"""
-        parsed_tafs = meteoparse.parse_tafs(TEST_TAFS_NORMAL)
-        regularized = list(meteoparse.regularize_tafs(parsed_tafs))
+        regularized = list(meteoparse.regularize_tafs(parsed_tafs["normal"]))
         assert len(regularized) == 2
-        assert len(regularized[0].from_lines) == 6
-        for i in range(6):
-            assert regularized[0].from_lines[i].valid_from.hour == i
+        from_lines = regularized[0].from_lines
+        assert len(from_lines) == 6
+        for i, from_line in enumerate(from_lines[:6]):
+            assert from_line.valid_from.hour == i
             # See that wind is as we set it in the TAF
-            assert regularized[0].from_lines[i].conditions.wind.speed == (5 if i < 3 else 10)
+            assert from_line.conditions.wind.speed == (5 if i < 3 else 10)
 
-    def test_regularize_tafs_pass_error(self):
+    def test_regularize_tafs_pass_error(self, parsed_tafs):
         """Test passing on an error from an improper TAF"""
-        parsed_tafs = meteoparse.parse_tafs(TEST_TAFS_ERROR)
-        regularized = list(meteoparse.regularize_tafs(parsed_tafs))
+        regularized = list(meteoparse.regularize_tafs(parsed_tafs["error"]))
         assert len(regularized) == 2
         assert isinstance(regularized[1], meteoparse.TafParseError)
 
-    def test_regularize_tafs_odd_hour(self):
+    def test_regularize_tafs_odd_hour(self, parsed_tafs):
         """Test a TAF with the validity not starting on a full hour"""
-        parsed_tafs = meteoparse.parse_tafs(TEST_TAFS_ODD_START)
-        regularized = list(meteoparse.regularize_tafs(parsed_tafs))
+        regularized = list(meteoparse.regularize_tafs(parsed_tafs["odd_start"]))
         assert len(regularized) == 2
-        assert len(regularized[0].from_lines) == 6
-        for i in range(5):
-            assert regularized[0].from_lines[i].valid_from.hour == i
+        from_lines = regularized[0].from_lines
+        assert len(from_lines) == 6
+        for i, from_line in enumerate(from_lines[:5]):
+            assert from_line.valid_from.hour == i
             # See that wind is as we set it in the TAF -- 3 is now still at 5 knots
-            assert regularized[0].from_lines[i].conditions.wind.speed == (5 if i <= 3 else 10)
+            assert from_line.conditions.wind.speed == (5 if i <= 3 else 10)
 
     def test_regularize_tafs_non_contiguous(self):
         """Test non-contiguous lines"""
+        # This modifies the parsed TAFs, so don't use the shared ones
         parsed_tafs = list(meteoparse.parse_tafs(TEST_TAFS_NORMAL))
         # Sneak in a non-contiguous time
         parsed_tafs[0].from_lines[1] = parsed_tafs[0].from_lines[1]._replace(
@@ -120,8 +133,7 @@ class TestRegularizeTafs:
         regularized = list(meteoparse.regularize_tafs(parsed_tafs))
         assert isinstance(regularized[0], meteoparse.TafParseError)
 
-    def test_regularize_tafs_nil(self):
+    def test_regularize_tafs_nil(self, parsed_tafs):
         """Test a TAF with no content"""
-        parsed_tafs = meteoparse.parse_tafs(TEST_TAFS_NIL)
-        regularized = list(meteoparse.regularize_tafs(parsed_tafs))
+        regularized = list(meteoparse.regularize_tafs(parsed_tafs["nil"]))
         assert regularized[1].from_lines is None
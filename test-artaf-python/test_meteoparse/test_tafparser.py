@@ -4,7 +4,9 @@ For testing the parser, it is simplest to go all the way from a TAF message to t
 parsed output instead of building a framework to set up as method as it would during parsing."""
 
 import datetime
+import functools
 import math
+import re
 import pytest
 
 import meteoparse.tafparser
@@ -17,6 +19,9 @@ TAF
 KTST 010020Z 0100/0200 """
 # pragma pylint: enable=trailing-whitespace
 
+# Both components of a unit vector at 45 degrees
+HALF_SQRT_2 = math.sqrt(2) / 2
+
 def parse_oneliner_taf(conditions_string):
     """
     Make and parse a simple one-liner TAF with the same conditions forecast for a day.
@@ -24,36 +29,56 @@ def parse_oneliner_taf(conditions_string):
     :param conditions_string: Conditions for the one-liner, e.g., "09005KT P6SM SKC"
     :return: the parsed TAF
     """
-    taf = SAMPLE_TAF_START + conditions_string + "="
+    taf = f"{SAMPLE_TAF_START}{conditions_string}="
+    return _parse_taf_cached(taf)
+
 
+@functools.lru_cache(maxsize=256)
+def _parse_taf_cached(taf):
+    """
+    Parse a TAF issued at the sample time. Several tests parse the same TAFs, and parsing is pure,
+    so we only do it once for each. Tests must not modify what they get.
+    :param taf: The TAF text
+    :return: the parsed TAF
+    """
     message_time = datetime.datetime(2024, 1, 1, 0, 20, 0)
-    parsed = meteoparse.tafparser.parse_taf(message_time, taf)
-    return parsed
+    return meteoparse.tafparser.parse_taf(message_time, taf)
 
 class TestParseTafsWinds:
     """Test whether winds get parsed correctly."""
 
-    def test_winds_valid_heading(self):
-        """Test that only wind headings of 000 to 360 are accepted"""
-
-        # Note that the range() ends before 360; i.e., the highest number tested is 359.
-        # We will test a heading of 360 a bit farther down.
-        for heading in range(0, 360):
-            parsed = parse_oneliner_taf(f"{heading:03d}05KT P6SM SKC")
-            wind = parsed.from_lines[0].conditions.wind
-            assert wind.direction == heading
-
-        # We will test a heading of 360 here, which should get auto-converted to a heading of 0.
-        # Also note that this same functionality is validated in test_winds_from_north.
-        parsed = parse_oneliner_taf("36005KT P6SM SKC")
+    # Every 15 degrees, plus both sides of each place the grammar's heading regex branches
+    @pytest.mark.parametrize("heading", sorted({*range(0, 360, 15), 9, 10, 99, 100, 199, 200,
+                                                299, 300, 309, 310, 349, 350, 359, 360}))
+    def test_winds_valid_heading(self, heading):
+        """Test that wind headings of 000 to 360 are accepted"""
+        parsed = parse_oneliner_taf(f"{heading:03d}05KT P6SM SKC")
         wind = parsed.from_lines[0].conditions.wind
-        assert wind.direction == 0
+        # A heading of 360 should get auto-converted to a heading of 0. Also note that this same
+        # functionality is validated in test_winds_from_north.
+        assert wind.direction == heading % 360
+
+    # We're blindly trusting that the regex will catch anything in excess of three digits.
+    @pytest.mark.parametrize("heading", [361, 362, 369, 370, 399, 400, 459, 500, 900, 999])
+    def test_winds_invalid_heading(self, heading):
+        """Test that all other wind headings fail"""
+        parsed_incorrect = parse_oneliner_taf(f"{heading:03d}05KT P6SM SKC")
+        assert isinstance(parsed_incorrect, meteoparse.tafparser.TafParseError)
 
-        # All other headings should fail. We're blindly trusting that the regex will catch anything
-        # in excess of three digits.
-        for heading in range(361, 1000):
-            parsed_incorrect = parse_oneliner_taf(f"{heading:03d}05KT P6SM SKC")
-            assert isinstance(parsed_incorrect, meteoparse.tafparser.TafParseError)
+    def test_winds_heading_patterns(self):
+        """Test that the patterns for wind headings accept exactly 000 to 360 and VRB. Matching
+        them directly lets us go through every heading without parsing a TAF for each."""
+        # Make sure the parser exists
+        assert not isinstance(parse_oneliner_taf("09005KT P6SM SKC"),
+                              meteoparse.tafparser.TafParseError)
+        grammar_pattern = meteoparse.tafparser.parse_taf.parser.get_terminal(
+            "WIND_DIRECTION_DEGREES").pattern.to_regexp()
+        fast_pattern = meteoparse.tafparser._FAST_WIND_DIRECTION  # pylint: disable=protected-access
+        for heading in range(1000):
+            heading_string = f"{heading:03d}"
+            assert (re.fullmatch(grammar_pattern, heading_string) is not None) == (heading <= 360)
+            assert (re.fullmatch(fast_pattern, heading_string) is not None) == (heading <= 360)
+        assert re.fullmatch(fast_pattern, "VRB")
 
     def test_winds_speed_heading(self):
         """Test that the speed and direction are correct in the Wind object."""
@@ -85,37 +110,32 @@ class TestParseTafsWinds:
         wind = parsed.from_lines[0].conditions.wind
         assert wind.direction == 0
 
-    def test_winds_cartesian(self):
+    # This is partly an exercise for myself to remember how the unit circle
+    # works, but I do see a little bit of value in verifying that the
+    # cartesian() method still spits out the right numbers; i.e. that math
+    # is still math.
+    #
+    # See https://www.youtube.com/watch?v=3QtRK7Y2pPU for more details
+    # re: the persistence of math.
+    @pytest.mark.parametrize("heading,north,east", [
+        (0,   1.0,          0.0),
+        (45,  HALF_SQRT_2,  HALF_SQRT_2),
+        (90,  0.0,          1.0),
+        (135, -HALF_SQRT_2, HALF_SQRT_2),
+        (180, -1.0,         0.0),
+        (225, -HALF_SQRT_2, -HALF_SQRT_2),
+        (270, 0.0,          -1.0),
+        (315, HALF_SQRT_2,  -HALF_SQRT_2),
+    ])
+    def test_winds_cartesian(self, heading, north, east):
         """Test that the Cartesian coordinates for given wind headings are correct."""
-
-        # This is partly an exercise for myself to remember how the unit circle
-        # works, but I do see a little bit of value in verifying that the
-        # cartesian() method still spits out the right numbers; i.e. that math
-        # is still math.
-        #
-        # See https://www.youtube.com/watch?v=3QtRK7Y2pPU for more details
-        # re: the persistence of math.
-
         windspeed = 5
-
-        winds_cartesian_components = (
-            {"heading": 0,   "north": 1.0,              "east": 0.0},
-            {"heading": 45,  "north": math.sqrt(2)/2,   "east": math.sqrt(2)/2},
-            {"heading": 90,  "north": 0.0,              "east": 1.0},
-            {"heading": 135, "north": -math.sqrt(2)/2,  "east": math.sqrt(2)/2},
-            {"heading": 180, "north": -1.0,             "east": 0.0},
-            {"heading": 225, "north": -math.sqrt(2)/2,  "east": -math.sqrt(2)/2},
-            {"heading": 270, "north": 0.0,              "east": -1.0},
-            {"heading": 315, "north": math.sqrt(2)/2,   "east": -math.sqrt(2)/2},
-        )
-
-        for wind in winds_cartesian_components:
-            wind_parsed = parse_oneliner_taf(f"{wind['heading']:03d}{windspeed:02d}KT P6SM SKC")
-            (north_coord, east_coord) = wind_parsed.from_lines[0].conditions.wind.cartesian()
-            # The pytest.approx() function is used to compensate for floating point error in the
-            # Wind.cartesian() method. By default, the approx() function uses 1e-6 precision.
-            assert north_coord == pytest.approx(windspeed * wind['north'])
-            assert east_coord == pytest.approx(windspeed * wind['east'])
+        wind_parsed = parse_oneliner_taf(f"{heading:03d}{windspeed:02d}KT P6SM SKC")
+        (north_coord, east_coord) = wind_parsed.from_lines[0].conditions.wind.cartesian()
+        # The pytest.approx() function is used to compensate for floating point error in the
+        # Wind.cartesian() method. By default, the approx() function uses 1e-6 precision.
+        assert north_coord == pytest.approx(windspeed * north)
+        assert east_coord == pytest.approx(windspeed * east)
 
 class TestParseTafsVisibility:
     """Test whether visibility conditions get parsed correctly"""
@@ -138,55 +158,25 @@ class TestParseTafsVisibility:
 class TestParseTafsClouds:
     """Test whether clouds get parsed correctly"""
 
-    def test_clouds_skc(self):
-        """Test SKC clouds"""
-        parsed = parse_oneliner_taf("09005KT P6SM SKC")
-        assert len(parsed.from_lines[0].conditions.clouds) == 1
-        layer = parsed.from_lines[0].conditions.clouds[0]
-        assert layer.is_sky_clear
-        assert layer.cloud_base is None
-        assert str(layer.coverage) == "SKC"
-        assert float(layer.coverage) == 0.0
-        assert not layer.is_cumulonimbus
-
-    def test_clouds_vv(self):
-        """Test VV clouds"""
-        parsed = parse_oneliner_taf("09005KT P6SM VV005")
-        assert len(parsed.from_lines[0].conditions.clouds) == 1
-        layer = parsed.from_lines[0].conditions.clouds[0]
-        assert not layer.is_sky_clear
-        assert layer.cloud_base == 500
-        assert str(layer.coverage) == "VV"
-        assert float(layer.coverage) == 1.0
-        assert not layer.is_cumulonimbus
-
-    def test_clouds_one_layer(self):
-        """Test ordinary cloud layers, one at a time"""
-        for message, base, coverage in [
-            ("FEW010", 1000, 0.125),
-            ("SCT015", 1500, 0.375),
-            ("BKN050", 5000, 0.6875),
-            ("OVC100", 10000, 0.9375),
-        ]:
-            parsed = parse_oneliner_taf("09005KT P6SM " + message)
-            assert len(parsed.from_lines[0].conditions.clouds) == 1
-            layer = parsed.from_lines[0].conditions.clouds[0]
-            assert not layer.is_sky_clear
-            assert layer.cloud_base == base
-            assert str(layer.coverage) == message[:3]
-            assert float(layer.coverage) == coverage
-            assert not layer.is_cumulonimbus
-
-    def test_clouds_cb(self):
-        """Test cumulonimbus"""
-        parsed = parse_oneliner_taf("09005KT P6SM BKN050CB")
-        assert len(parsed.from_lines[0].conditions.clouds) == 1
-        layer = parsed.from_lines[0].conditions.clouds[0]
-        assert not layer.is_sky_clear
-        assert layer.cloud_base == 5000
-        assert str(layer.coverage) == "BKN"
-        assert float(layer.coverage) == 0.6875
-        assert layer.is_cumulonimbus
+    @pytest.mark.parametrize("message,base,coverage,is_cumulonimbus", [
+        ("SKC", None, 0.0, False),
+        ("VV005", 500, 1.0, False),
+        ("FEW010", 1000, 0.125, False),
+        ("SCT015", 1500, 0.375, False),
+        ("BKN050", 5000, 0.6875, False),
+        ("OVC100", 10000, 0.9375, False),
+        ("BKN050CB", 5000, 0.6875, True),
+    ])
+    def test_cloud_layer(self, message, base, coverage, is_cumulonimbus):
+        """Test a single cloud layer of each kind"""
+        clouds = parse_oneliner_taf("09005KT P6SM " + message).from_lines[0].conditions.clouds
+        assert len(clouds) == 1
+        layer = clouds[0]
+        assert layer.is_sky_clear == (message == "SKC")
+        assert layer.cloud_base == base
+        assert str(layer.coverage) == message[:3].rstrip("0123456789")
+        assert float(layer.coverage) == coverage
+        assert layer.is_cumulonimbus == is_cumulonimbus
 
     def test_clouds_multilayer(self):
         """Test several cloud layers"""
@@ -197,10 +187,9 @@ class TestParseTafsClouds:
             ("OVC100", 10000, 0.9375),
         ]
         message = "09005KT P6SM  " + (" ".join([m for m, _, _ in test_clouds]))
-        parsed = parse_oneliner_taf(message)
-        assert len(parsed.from_lines[0].conditions.clouds) == len(test_clouds)
-        for layer, (cloud_string, base, coverage) in \
-                zip(parsed.from_lines[0].conditions.clouds, test_clouds):
+        clouds = parse_oneliner_taf(message).from_lines[0].conditions.clouds
+        assert len(clouds) == len(test_clouds)
+        for layer, (cloud_string, base, coverage) in zip(clouds, test_clouds):
             assert not layer.is_sky_clear
             assert layer.cloud_base == base
             assert str(layer.coverage) == cloud_string[:3]
@@ -235,3 +224,60 @@ class TestParseTafsClouds:
         for (layer, plain_english) in \
             zip(parsed.from_lines[0].conditions.clouds, english_strings):
             assert str(layer) == plain_english
+
+
+def describe_parsed_taf(parsed):
+    """
+    Boil a parsed TAF down to plain values so that the results of different parser paths can be
+    compared
+    :param parsed: ParsedForecast
+    :return: A tuple of plain values
+    """
+    from_lines = None if parsed.from_lines is None else [
+        (line.valid_from, line.valid_until,
+         line.conditions.wind.direction, line.conditions.wind.speed, line.conditions.wind.gust,
+         line.conditions.visibility.visibility_miles, line.conditions.visibility.is_excess,
+         [(c.cloud_base, str(c.coverage), c.is_cumulonimbus) for c in line.conditions.clouds])
+        for line in parsed.from_lines]
+    return (parsed.aerodrome, parsed.issued_at, parsed.issued_in, parsed.valid_from,
+            parsed.valid_until, parsed.amendment, from_lines)
+
+
+class TestParseTafsFastPath:
+    """Test that the fast path gives the same results as parsing with Lark and that it leaves
+    everything out of the ordinary to Lark"""
+
+    message_time = datetime.datetime(2024, 1, 1, 0, 20, 0)
+
+    @pytest.mark.parametrize("conditions", [
+        "09005KT P6SM SKC",
+        "VRB03KT 1/2SM FG VV002",
+        "36010G20KT 1 1/2SM -SHRA BR FEW010 SCT020CB OVC100 WS020/27045KT",
+        "03005KT P6SM SKC\n    FM010300 03010KT 3SM +TSRA BKN010CB\n"
+        "    FM011530 00000KT 6SM SKC",
+        "NIL"
+    ])
+    def test_fast_path_same_as_lark(self, conditions):
+        """Plain TAFs should come out exactly the same on either path"""
+        taf = SAMPLE_TAF_START + conditions + "="
+        # pylint: disable=protected-access
+        fast = meteoparse.tafparser._fast_parse(self.message_time, taf)
+        slow = meteoparse.tafparser.parse_taf(self.message_time, taf)
+        assert fast is not None
+        assert describe_parsed_taf(fast) == describe_parsed_taf(slow)
+
+    @pytest.mark.parametrize("conditions", [
+        "09005KT P6SM SKC TEMPO 0102/0104 -RA",
+        "09005KT P6SM SKC PROB30 0102/0104 TSRA",
+        "09005KT P6SM BKN010 OVC030 FEW020",
+        "09005G05KT P6SM SKC",
+        "09005KT P6SM INV005",
+    ])
+    def test_fast_path_declines(self, conditions):
+        """TAFs out of the ordinary should be left to Lark, including ones that are errors"""
+        taf = SAMPLE_TAF_START + conditions + "="
+        # pylint: disable=protected-access
+        assert meteoparse.tafparser._fast_parse(self.message_time, taf) is None
+        fast = meteoparse.tafparser.parse_taf(self.message_time, taf, fast_path=True)
+        slow = meteoparse.tafparser.parse_taf(self.message_time, taf)
+        assert type(fast) is type(slow)  # pylint: disable=unidiomatic-typecheck
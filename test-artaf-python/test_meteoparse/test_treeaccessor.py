@@ -2,7 +2,7 @@
 import pytest
 from lark import Token, Tree
 
-from meteoparse.tree_accessor import TreeAccessor
+from meteoparse.tree_accessor import TreeAccessor, make_tree_accessor_class
 
 
 class TestTreeAccessor:
@@ -34,3 +34,17 @@ class TestTreeAccessor:
         accessor = TreeAccessor([Tree("tree1", []), Tree("tree2", [])])
         subtree = accessor[0]
         assert isinstance(subtree, TreeAccessor)
+        # The same subtree gives the same accessor, however we get to it
+        assert accessor[0] is subtree
+        assert accessor["tree1"][0] is subtree
+        assert accessor[:1][0] is subtree
+
+    def test_generated_properties(self):
+        """Check that accessor classes with generated properties behave like plain accessors"""
+        accessor_class = make_tree_accessor_class(("Token1", "Token3"))
+        assert make_tree_accessor_class(("Token1", "Token3")) is accessor_class
+        accessor = accessor_class([Token("Token1", 1), Token("Token2", 2), Token("Token2", 3)])
+        assert accessor.Token1.value == 1
+        assert [t.value for t in accessor["Token2"]] == [2, 3]
+        assert not hasattr(accessor, "Token3")
+        assert isinstance(accessor, TreeAccessor)
@@ -0,0 +1,3 @@
+"""Tests for meteostore. Also exports a helper function make_taf_archives"""
+
+from test_meteostore.test_store import ARCHIVE_YEARS, make_taf_archives
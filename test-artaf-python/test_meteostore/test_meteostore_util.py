@@ -11,5 +11,5 @@ class TestGetStationList: # pylint: disable=too-few-public-methods
         """Test get_station_list()"""
         stations = meteostore.get_station_list()
         assert 650 < len(stations) < 750
-        kenosha = [s for s in stations if s.station == "KENW"][0]
+        kenosha = next(s for s in stations if s.station == "KENW")
         assert kenosha.name == "KENOSHA"
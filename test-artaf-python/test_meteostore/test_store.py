@@ -1,11 +1,66 @@
 """Test meteostore.store"""
 
 import datetime
+import io
+import os.path
+import zipfile
 
 import pytest
 import pytz
 
 import meteostore
+import meteostore.store
+
+ARCHIVE_YEARS = (2022, 2023)
+
+
+def _make_taf(station, year, i):
+    """
+    Make up a TAF that varies with i. Every third one has a TEMPO group, which the parser's fast
+    path leaves to Lark.
+    :param station: The station code
+    :param year: The year of issue
+    :param i: The number of the TAF
+    :return: A tuple of the time of issue and the TAF text
+    """
+    issued = datetime.datetime(year, 1 + i % 12, 1 + i, 5 * i % 24, 20)
+    valid_from = issued.replace(minute=0) + datetime.timedelta(hours=1)
+    valid_until = valid_from + datetime.timedelta(hours=24)
+    from_time = valid_from + datetime.timedelta(hours=3)
+    tempo = f" TEMPO {from_time:%d%H}/{from_time + datetime.timedelta(hours=2):%d%H} 3SM BR" \
+        if i % 3 == 2 else ""
+    return issued, (f"000 \nFTUS41 {station} {issued:%d%H%M}\nTAF{station[1:]}\nTAF\n"
+                    f"{station} {issued:%d%H%M}Z {valid_from:%d%H}/{valid_until:%d%H} "
+                    f"{40 * i % 360:03d}{5 + i:02d}KT P6SM SKC\n"
+                    f"     FM{from_time:%d%H%M} {70 * i % 360:03d}{3 + i:02d}G{20 + i}KT "
+                    f"{1 + i % 6}SM BKN0{10 + i:02d}{tempo}=")
+
+
+def make_taf_archives(directory, compression):
+    """
+    Make yearly archives laid out like the ones we download, with a few made-up TAFs for two
+    stations
+    :param directory: Where to put the archives
+    :param compression: How to compress the station files within the yearly archives
+    :return: The stations, and a dict of station codes and lists of their (time, text) tuples in
+    chronological order
+    """
+    stations = [meteostore.StationDesc(code, code, 0.0, 0.0, code) for code in ("KTST", "KXYZ")]
+    expected = {station.station: [] for station in stations}
+    for year in ARCHIVE_YEARS:
+        with zipfile.ZipFile(os.path.join(directory, f"TAF{year}.zip"), "w",
+                             compression) as year_zip:
+            for station in stations:
+                tafs = sorted(_make_taf(station.station, year, i) for i in range(7))
+                expected[station.station].extend(tafs)
+                station_file = io.BytesIO()
+                with zipfile.ZipFile(station_file, "w", zipfile.ZIP_DEFLATED) as station_zip:
+                    # We should get them in chronological order whatever the order in the archive
+                    for time, text in reversed(tafs):
+                        station_zip.writestr(f"TAF{station.station[1:]}_{time:%Y%m%d%H%M}.txt",
+                                             text)
+                year_zip.writestr(station.station + ".zip", station_file.getvalue())
+    return stations, expected
 
 
 class TestStore():
@@ -23,6 +78,11 @@ class TestStore():
         res = meteostore.store.cleanup_datetime(datetime.datetime(2024, 1, 1, 2, 15))
         assert res == datetime.datetime(2024, 1, 1, 2, 15)
 
+    def test_cleanup_datetime_seconds(self):
+        """Seconds and microseconds should be dropped, but not minutes"""
+        res = meteostore.store.cleanup_datetime(datetime.datetime(2024, 1, 1, 12, 30, 45, 500))
+        assert res == datetime.datetime(2024, 1, 1, 12, 30)
+
     def test_cleanup_datetime_timezone(self):
         """A datetime with a time zone should be rejected"""
         with pytest.raises(ValueError):
@@ -34,6 +94,14 @@ class TestStore():
         with pytest.raises(AttributeError):
             meteostore.store.cleanup_datetime("today")
 
+    def test_parse_taf_file_name(self):
+        """TAF file names in the archive should give their issue time"""
+        # pylint: disable=protected-access
+        res = meteostore.store._parse_taf_file_name("TAFORD_202402291720.txt")
+        assert res == datetime.datetime(2024, 2, 29, 17, 20)
+        with pytest.raises(ValueError):
+            meteostore.store._parse_taf_file_name("METORD_202402291720.txt")
+
     def test_get_tafs_year_check(self):
         """Check that we're refusing to download for the present year"""
         current_year = datetime.datetime.now().year
@@ -43,6 +111,7 @@ class TestStore():
             list(meteostore.get_tafs(stations, 2024, current_year))
 
 
+    @pytest.mark.network
     def test_get_tafs(self):
         """Test TAF retrieval. We should have something for O'Hare"""
         stations = [s for s in meteostore.get_station_list() if s.station == "KORD"]
@@ -52,3 +121,243 @@ class TestStore():
             for _ in tafs:
                 count += 1
         assert 3300 < count < 3400
+
+
+class TestGetTafsFromArchive:
+    """Test reading TAFs with meteostore.get_tafs() from yearly archives we make up on the spot"""
+
+    @pytest.fixture(params=[zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED], ids=["stored", "deflated"])
+    def archive(self, request, tmp_path, monkeypatch):
+        """Make yearly archives in a temporary data directory"""
+        monkeypatch.setattr(meteostore.store, "DATA_PATH", str(tmp_path))
+        return make_taf_archives(str(tmp_path), request.param)
+
+    def test_get_tafs(self, archive):
+        """We should get every station's TAFs in chronological order"""
+        stations, expected = archive
+        res = {station.station: list(tafs) for station, tafs in
+               meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True)}
+        assert res == expected
+        assert all(isinstance(taf, meteostore.store.TimeTafRecord) for taf in res["KTST"])
+        assert all(isinstance(taf.text, str) for taf in res["KTST"])
+
+    def test_get_tafs_batched(self, archive):
+        """Batches should add up to the same TAFs"""
+        stations, expected = archive
+        for station, batches in meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True,
+                                                    batch_size=3):
+            batches = list(batches)
+            assert all(0 < len(batch) <= 3 for batch in batches)
+            assert [taf for batch in batches for taf in batch] == expected[station.station]
+
+    def test_get_tafs_early_close(self, archive):
+        """Giving up halfway through a station should close everything cleanly"""
+        stations, expected = archive
+        res = meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True, batch_size=1)
+        _, batches = next(res)
+        assert next(batches) == expected["KTST"][:1]
+        res.close()
+        # The station's TAFs get closed along with the archives
+        with pytest.raises(StopIteration):
+            next(batches)
+
+
+    @pytest.mark.parametrize("entry", [b"short", b"not a zip file at all, if long enough"],
+                             ids=["short", "long"])
+    def test_get_tafs_corrupt_station(self, archive, entry):
+        """A station file that isn't a ZIP file should say so, whatever the yearly archive's
+        compression"""
+        stations, _ = archive
+        for year in ARCHIVE_YEARS:
+            with zipfile.ZipFile(os.path.join(meteostore.store.DATA_PATH, f"TAF{year}.zip"),
+                                 "a") as year_zip:
+                year_zip.writestr("KBAD.zip", entry,
+                                  year_zip.getinfo(stations[0].station + ".zip").compress_type)
+        res = meteostore.get_tafs([meteostore.StationDesc("KBAD", "KBAD", 0.0, 0.0, "KBAD")],
+                                  *ARCHIVE_YEARS, read_only=True)
+        _, tafs = next(res)
+        with pytest.raises(zipfile.BadZipFile):
+            next(tafs)
+        res.close()
+
+    def test_get_tafs_undecoded(self, archive):
+        """If asked not to decode, we should get the TAF texts as ASCII bytes"""
+        stations, expected = archive
+        for station, tafs in meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True,
+                                                 decode=False):
+            tafs = list(tafs)
+            assert all(isinstance(taf.text, bytes) for taf in tafs)
+            assert [(taf.time, taf.text.decode("ascii")) for taf in tafs] \
+                == expected[station.station]
+
+    def test_get_tafs_raw(self, archive):
+        """If asked for raw TAFs, we should get plain tuples rather than TimeTafRecords"""
+        stations, expected = archive
+        for station, batches in meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True,
+                                                    batch_size=3, raw=True):
+            tafs = [taf for batch in batches for taf in batch]
+            assert all(type(taf) is tuple for taf in tafs)  # pylint: disable=unidiomatic-typecheck
+            assert tafs == expected[station.station]
+
+    @pytest.mark.parametrize("prefetch", [1, 2, 5])
+    def test_get_tafs_prefetch(self, archive, prefetch):
+        """Reading stations ahead in worker threads shouldn't change what we get or its order"""
+        stations, expected = archive
+        stations = stations[::-1]
+        res = [(station.station, list(tafs)) for station, tafs in
+               meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True,
+                                   prefetch=prefetch)]
+        assert res == [(station.station, expected[station.station]) for station in stations]
+
+    def test_get_tafs_prefetch_batched(self, archive):
+        """Prefetched batches should add up to the same TAFs"""
+        stations, expected = archive
+        for station, batches in meteostore.get_tafs(stations, *ARCHIVE_YEARS, read_only=True,
+                                                    batch_size=3, prefetch=1):
+            batches = list(batches)
+            assert all(0 < len(batch) <= 3 for batch in batches)
+            assert [taf for batch in batches for taf in batch] == expected[station.station]
+
+    def test_prefetch_early_close(self):
+        """If our consumer gives up early, we shouldn't go on reading stations for nobody"""
+        # pylint: disable=protected-access
+        read = []
+
+        def read_station(station):
+            read.append(station)
+            return [station]
+
+        stations = list(range(10))
+        res = meteostore.store._prefetch_stations(stations, 2, read_station)
+        assert next(res) == (0, [0])
+        res.close()
+        # Only what we had already asked the workers for can have been read
+        assert set(read) <= {0, 1, 2}
+
+    def test_prefetch_exception(self):
+        """An exception reading a station ahead should reach the consumer at that station"""
+        # pylint: disable=protected-access
+
+        def read_station(station):
+            if station == 2:
+                raise KeyError(station)
+            return [station]
+
+        res = meteostore.store._prefetch_stations(list(range(5)), 2, read_station)
+        assert next(res) == (0, [0])
+        assert next(res) == (1, [1])
+        with pytest.raises(KeyError):
+            next(res)
+        # The generator is done once it has raised
+        with pytest.raises(StopIteration):
+            next(res)
+
+
+class TestAppendToArchive:
+    """Test adding stations to a yearly archive in place the way download_tafs() does, without
+    downloading anything"""
+
+    @pytest.fixture
+    def archive_paths(self, tmp_path):
+        """Make yearly archives and return the paths of one and of the backup of its directory"""
+        make_taf_archives(str(tmp_path), zipfile.ZIP_STORED)
+        file_path = os.path.join(str(tmp_path), f"TAF{ARCHIVE_YEARS[0]}.zip")
+        return file_path, file_path + ".directory~"
+
+    def test_finish(self, archive_paths):
+        """Added stations should end up in the archive, and the backup should go away"""
+        # pylint: disable=protected-access
+        file_path, backup_path = archive_paths
+        with meteostore.store._open_archive_file(file_path) as archive_file:
+            zip_file = meteostore.store._append_to_archive(archive_file, backup_path,
+                                                           zipfile.ZIP_STORED)
+            assert os.path.exists(backup_path)
+            zip_file.writestr("KNEW.zip", b"new")
+            meteostore.store._finish_archive(zip_file, archive_file, backup_path)
+        assert not os.path.exists(backup_path)
+        with zipfile.ZipFile(file_path, "r") as zip_file:
+            assert zip_file.namelist() == ["KTST.zip", "KXYZ.zip", "KNEW.zip"]
+            assert zip_file.testzip() is None
+
+    def test_new_archive(self, archive_paths):
+        """We should be able to start a yearly archive from scratch"""
+        # pylint: disable=protected-access
+        file_path, backup_path = archive_paths
+        os.unlink(file_path)
+        with meteostore.store._open_archive_file(file_path) as archive_file:
+            zip_file = meteostore.store._append_to_archive(archive_file, backup_path,
+                                                           zipfile.ZIP_STORED)
+            zip_file.writestr("KNEW.zip", b"new")
+            meteostore.store._finish_archive(zip_file, archive_file, backup_path)
+        with zipfile.ZipFile(file_path, "r") as zip_file:
+            assert zip_file.namelist() == ["KNEW.zip"]
+
+    def test_restore_after_checkpoint(self, archive_paths):
+        """If we get interrupted while adding stations, we should get the archive back as of the
+        last checkpoint"""
+        # pylint: disable=protected-access
+        file_path, backup_path = archive_paths
+        with meteostore.store._open_archive_file(file_path) as archive_file:
+            zip_file = meteostore.store._append_to_archive(archive_file, backup_path,
+                                                           zipfile.ZIP_STORED)
+            zip_file.writestr("KONE.zip", b"one")
+            zip_file = meteostore.store._checkpoint_archive(zip_file, archive_file, backup_path,
+                                                            zipfile.ZIP_STORED)
+            # Tear the archive's end as a crash halfway through adding another station might
+            zip_file.close()
+            archive_file.seek(zip_file.start_dir)
+            archive_file.write(b"torn" * 100)
+            archive_file.truncate()
+        meteostore.store._restore_archive_directory(file_path, backup_path)
+        assert not os.path.exists(backup_path)
+        with zipfile.ZipFile(file_path, "r") as zip_file:
+            assert zip_file.namelist() == ["KTST.zip", "KXYZ.zip", "KONE.zip"]
+            assert zip_file.testzip() is None
+
+    def test_download_interrupted(self, archive_paths, monkeypatch):
+        """If we get interrupted halfway through writing a station, it mustn't end up in the
+        archive, or we'd never download it again"""
+        # pylint: disable=protected-access
+        file_path, backup_path = archive_paths
+
+        class InterruptedDownload(io.BytesIO):
+            """A download that gets interrupted after its first chunk"""
+
+            def read(self, size=-1, /):
+                if self.tell():
+                    raise KeyboardInterrupt()
+                return super().read(size)
+
+        monkeypatch.setattr(meteostore.store, "READ_BUFFER_SIZE", 16)
+        monkeypatch.setattr(meteostore.store, "_download_station_year",
+                            lambda session, station, *_: (station, InterruptedDownload(b"x" * 64)))
+        with pytest.raises(KeyboardInterrupt):
+            meteostore.store._download_year(None, ARCHIVE_YEARS[0], [("KNEW", "KNEW")], file_path,
+                                            backup_path, zipfile.ZIP_STORED)
+        assert not os.path.exists(backup_path)
+        with zipfile.ZipFile(file_path, "r") as zip_file:
+            assert zip_file.namelist() == ["KTST.zip", "KXYZ.zip"]
+            assert zip_file.testzip() is None
+
+    def test_read_only_leaves_unfinished_download(self, archive_paths):
+        """Reading read-only mustn't restore an archive someone else may be adding to"""
+        # pylint: disable=protected-access
+        file_path, backup_path = archive_paths
+        with meteostore.store._open_archive_file(file_path) as archive_file:
+            zip_file = meteostore.store._append_to_archive(archive_file, backup_path,
+                                                           zipfile.ZIP_STORED)
+            zip_file.writestr("KNEW.zip", b"new")
+            zip_file.close()
+        with open(file_path, "rb") as archive_file:
+            archive = archive_file.read()
+        with pytest.raises(FileNotFoundError):
+            meteostore.store._prepare_taf_download([("KTST", "KTST")], file_path, backup_path,
+                                                   False, True)
+        assert os.path.exists(backup_path)
+        with open(file_path, "rb") as archive_file:
+            assert archive_file.read() == archive
+        # Once we may write, we go back to the archive as it was before the unfinished download
+        assert meteostore.store._prepare_taf_download([("KTST", "KTST"), ("KNEW", "KNEW")],
+                                                      file_path, backup_path, False,
+                                                      False) == [("KNEW", "KNEW")]
+        assert not os.path.exists(backup_path)